@@ -0,0 +1,103 @@
+# how far the sound of a fight carries
+ATTACK_NOISE_RADIUS = 6
+
+
+class ActivationManager:
+    def __init__(self, entities, scheduler, wake_radius=2, sleep_after=20):
+        """
+        Keeps monsters dormant until something wakes them, so that only awake monsters are in the turn scheduler.
+        Monsters wake when the player sees them, comes within wake_radius of them or makes noise nearby, and fall
+        back asleep after not seeing the player for sleep_after turns.
+
+        Waking only looks at the cells around the player or the noise, so dormant monsters cost nothing per turn.
+
+        :param entities: EntityIndex
+        :param scheduler: TurnScheduler
+        :param wake_radius: int
+        :param sleep_after: int
+        """
+        self.entities = entities
+        self.scheduler = scheduler
+        self.wake_radius = wake_radius
+        self.sleep_after = sleep_after
+
+        # awake entity -> last turn it saw the player
+        self.awake = {}
+        self.turn = 0
+
+    def __len__(self):
+        return len(self.awake)
+
+    def __contains__(self, entity):
+        return entity in self.awake
+
+    def wake(self, entity):
+        """
+        Wakes entity if it has an AI and is dormant.
+
+        :param entity: Entity
+        """
+        if entity.ai and entity not in self.awake:
+            self.awake[entity] = self.turn
+            self.scheduler.schedule(entity)
+
+    def sleep(self, entity):
+        """
+        Makes entity dormant.
+
+        :param entity: Entity
+        """
+        if entity in self.awake:
+            del self.awake[entity]
+            self.scheduler.remove(entity)
+
+    def wake_area(self, x, y, radius, mask=None):
+        """
+        Wakes monsters within radius cells of a position.
+
+        :param x: int
+        :param y: int
+        :param radius: int
+        :param mask: numpy.ndarray<bool>/None (only cells set in mask wake)
+        """
+        for cell_x in range(x - radius, x + radius + 1):
+            for cell_y in range(y - radius, y + radius + 1):
+                for entity in self.entities.get_entities_at(cell_x, cell_y):
+                    if entity.ai and (mask is None or mask[cell_x, cell_y]):
+                        self.wake(entity)
+
+    def wake_near_player(self, player, fov, fov_radius):
+        """
+        Wakes monsters the player can see or is standing close to.
+
+        :param player: Entity
+        :param fov: numpy.ndarray<bool>
+        :param fov_radius: int
+        """
+        self.wake_area(player.x, player.y, fov_radius, fov)
+        self.wake_area(player.x, player.y, self.wake_radius)
+
+    def make_noise(self, x, y, radius=ATTACK_NOISE_RADIUS):
+        """
+        Wakes monsters that hear a noise.
+
+        :param x: int
+        :param y: int
+        :param radius: int
+        """
+        self.wake_area(x, y, radius)
+
+    def update(self, turn, fov):
+        """
+        Puts awake monsters that lost track of the player back to sleep.
+
+        :param turn: int
+        :param fov: numpy.ndarray<bool> (the player's field of view)
+        """
+        self.turn = turn
+
+        for entity, last_seen in list(self.awake.items()):
+            if fov[entity.x, entity.y]:
+                self.awake[entity] = turn
+            elif turn - last_seen >= self.sleep_after:
+                self.sleep(entity)
@@ -0,0 +1,438 @@
+"""
+Benchmarks for the hot paths: map generation, FOV, pathfinding, enemy turns, combat and rendering, plus the memory
+taken by each monster.
+
+Usage:
+    python benchmark.py run [--quick] [--output FILE] [--only NAME ...]
+    python benchmark.py compare OLD_FILE NEW_FILE [--threshold 0.1]
+
+Every scenario is seeded, so two runs on the same code do the same work.
+"""
+import argparse
+import gc
+import itertools
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import tdl
+
+from components.ai import BasicMonster
+from components.fighter import Fighter
+from components.fighter_store import FighterStore
+from components.light import Light
+from entity import Entity
+from entity_index import EntityIndex
+from fov_cache import FovCache
+from game_messages import MessageLog
+from game_session import GameSession
+from map_utils import GameMap, make_map
+from palette import Palette
+from render_damage import DamageTracker
+from render_functions import render_all, RenderOrder
+
+
+# name, map width, map height, number of monsters
+SCENARIOS = [
+    ('tiny', 80, 45, 10),
+    ('small', 200, 120, 1000),
+    ('large', 500, 500, 10000),
+    ('huge', 1000, 1000, 50000),
+]
+
+QUICK_SCENARIOS = ['tiny', 'small']
+
+COLORS = Palette({
+    'dark_wall': (0, 0, 100),
+    'dark_ground': (50, 50, 150),
+    'light_wall': (130, 110, 50),
+    'light_ground': (200, 180, 50),
+    'desaturated_green': (63, 127, 63),
+    'darker_green': (0, 127, 0),
+    'dark_red': (191, 0, 0),
+    'white': (255, 255, 255),
+    'black': (0, 0, 0),
+    'red': (255, 0, 0),
+    'orange': (255, 127, 0),
+    'light_red': (255, 114, 114),
+    'darker_red': (127, 0, 0),
+    "violet": (148, 0, 211)
+})
+
+SEED = 1234
+
+PANEL_HEIGHT = 7
+
+
+def measure(function, repeat):
+    """
+    Runs function repeatedly and returns its timings.
+
+    :param function: callable
+    :param repeat: int
+    :return: list<float> (seconds)
+    """
+    timings = []
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def measure_memory(function):
+    """
+    Returns the memory still allocated by function's return value.
+
+    :param function: callable
+    :return: int (bytes)
+    """
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        result = function()
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    del result
+
+    return allocated
+
+
+def create_monsters(count):
+    """
+    Creates count orcs on a fresh index with a fighter store, as a level would hold them.
+
+    :param count: int
+    :return: EntityIndex
+    """
+    entities = EntityIndex()
+    entities.attach_fighters(FighterStore())
+
+    for i in range(count):
+        entities.append(Entity(i % 1000, i // 1000, 'o', COLORS.id('desaturated_green'), 'Orc', blocks=True,
+                               render_order=RenderOrder.ACTOR, fighter=Fighter(hp=10, defense=0, power=3),
+                               ai=BasicMonster()))
+
+    return entities
+
+
+def generate_level(width, height, seed):
+    """
+    Generates a seeded level the way the game does, scaled to map size.
+
+    :param width: int
+    :param height: int
+    :param seed: int
+    :return: tuple(GameMap, Entity, EntityIndex)
+    """
+    random.seed(seed)
+
+    player = Entity(0, 0, '@', COLORS.id('white'), 'Player', render_order=RenderOrder.ACTOR,
+                    blocks=True, fighter=Fighter(hp=30, defense=2, power=5), light=Light(10, COLORS.get('white')))
+    entities = EntityIndex([player])
+
+    game_map = GameMap(width, height)
+    # roughly the density of the 80x45 map with 30 rooms
+    max_rooms = max(30, width * height // 120)
+    make_map(game_map, max_rooms, 6, 10, width, height, player, entities, 3, COLORS, 2)
+
+    return game_map, player, entities
+
+
+def spawn_monsters(game_map, entities, count, seed):
+    """
+    Adds orcs on random free floor tiles until there are count monsters.
+
+    :param game_map: GameMap
+    :param entities: EntityIndex
+    :param count: int
+    :param seed: int
+    """
+    rng = random.Random(seed)
+
+    floor = list(zip(*game_map.walkable.nonzero()))
+    rng.shuffle(floor)
+
+    monsters = sum(1 for entity in entities if entity.ai)
+
+    for x, y in floor:
+        if monsters >= count:
+            break
+
+        x, y = int(x), int(y)
+
+        if not entities.get_entities_at(x, y):
+            entities.append(Entity(x, y, 'o', COLORS.id('desaturated_green'), 'Orc', blocks=True,
+                                   render_order=RenderOrder.ACTOR, fighter=Fighter(hp=10, defense=0, power=3),
+                                   ai=BasicMonster()))
+            monsters += 1
+
+
+def random_floor_pairs(game_map, count, seed):
+    """
+    Returns pairs of random floor tiles.
+
+    :param game_map: GameMap
+    :param count: int
+    :param seed: int
+    :return: list<tuple<tuple<int>>>
+    """
+    rng = random.Random(seed)
+    floor = [(int(x), int(y)) for x, y in zip(*game_map.walkable.nonzero())]
+
+    return [(rng.choice(floor), rng.choice(floor)) for i in range(count)]
+
+
+def resolve_attacks(session, attackers, targets):
+    """
+    Resolves many attacks at once through the session's fighter store, without building results or messages per
+    hit. Attacks are simultaneous. Dead entities are killed afterwards.
+
+    :param session: GameSession
+    :param attackers: list<Entity>
+    :param targets: list<Entity>
+    :return: list<Entity> (entities killed)
+    """
+    damage, dead_ids = session.fighters.resolve_attacks([attacker.fighter.id for attacker in attackers],
+                                                        [target.fighter.id for target in targets])
+
+    dead_entities = [session.fighters.fighters[fighter_id].owner for fighter_id in sorted(dead_ids)]
+
+    for dead_entity in dead_entities:
+        session.process_results([{'dead': dead_entity}])
+
+    return dead_entities
+
+
+def run_scenario(name, width, height, monster_count, repeat, only):
+    """
+    Runs all benchmarks of a scenario.
+
+    :param name: string
+    :param width: int
+    :param height: int
+    :param monster_count: int
+    :param repeat: int
+    :param only: list<string>/None
+    :return: list<dict>
+    """
+    results = []
+    params = {'scenario': name, 'width': width, 'height': height, 'monsters': monster_count}
+
+    def record(benchmark, function, times=repeat):
+        if only and benchmark not in only:
+            return
+
+        timings = measure(function, times)
+        results.append(dict(params, name=benchmark, repeat=times, unit='s', min=min(timings),
+                            median=statistics.median(timings), mean=statistics.mean(timings)))
+        print('{0:>8} {1:<24} {2:>12.6f} s'.format(name, benchmark, statistics.median(timings)))
+
+    def record_memory(benchmark, function, count):
+        if only and benchmark not in only:
+            return
+
+        per_entity = measure_memory(function) / count
+        results.append(dict(params, name=benchmark, repeat=1, unit='bytes', min=per_entity, median=per_entity,
+                            mean=per_entity))
+        print('{0:>8} {1:<24} {2:>12.1f} bytes'.format(name, benchmark, per_entity))
+
+    if monster_count:
+        record_memory('monster_memory', lambda: create_monsters(monster_count), monster_count)
+
+    record('make_map', lambda: generate_level(width, height, SEED), times=max(1, repeat // 5))
+
+    game_map, player, entities = generate_level(width, height, SEED)
+    spawn_monsters(game_map, entities, monster_count, SEED)
+
+    record('compute_fov', lambda: game_map.compute_fov(player.x, player.y, fov='BASIC', radius=10, light_walls=True))
+
+    fov_cache = FovCache()
+    corridor = itertools.cycle(random_floor_pairs(game_map, 4, SEED))
+
+    def cached_fov():
+        # pacing between a few spots, as players do in corridors and rooms
+        (x, y), (other_x, other_y) = next(corridor)
+        fov_cache.compute_fov(game_map, x, y, fov='BASIC', radius=10, light_walls=True)
+
+    record('cached_fov', cached_fov)
+
+    pairs = iter(random_floor_pairs(game_map, repeat, SEED))
+
+    def compute_path():
+        (start_x, start_y), (target_x, target_y) = next(pairs)
+        game_map.compute_path(start_x, start_y, target_x, target_y)
+
+    record('compute_path', compute_path)
+
+    monsters = itertools.cycle([entity for entity in entities if entity.ai])
+
+    def move_towards():
+        monster = next(monsters)
+        if monster.distance_to(player) >= 2:
+            monster.move_towards(player.x, player.y, game_map, entities)
+
+    record('move_towards', move_towards)
+
+    session = GameSession(player, entities, game_map, MessageLog(22, 58, PANEL_HEIGHT - 1), COLORS)
+    # keep the player alive for as many turns as the benchmarks take
+    player.fighter.defense = 1000
+    session.update_fov()
+
+    record('enemy_turn', session.play_enemy_turn)
+
+    # every monster hits the next one; they are made sturdy enough to survive every run, so each run does the same
+    # work and the level is unchanged for the benchmarks below
+    fighters = [entity for entity in entities if entity.fighter and entity is not player]
+    targets = fighters[1:] + fighters[:1]
+    saved_hp = [(fighter.fighter.hp, fighter.fighter.max_hp) for fighter in fighters]
+
+    for fighter in fighters:
+        fighter.fighter.max_hp = fighter.fighter.hp = 10 ** 9
+
+    record('batch_attacks', lambda: resolve_attacks(session, fighters, targets))
+
+    def attack_loop():
+        for attacker, target in zip(fighters, targets):
+            session.process_results(attacker.fighter.attack(target))
+
+    # the same attacks one at a time, with results and messages, as the batch API replaces
+    record('attack_loop', attack_loop)
+
+    for fighter, (hp, max_hp) in zip(fighters, saved_hp):
+        fighter.fighter.max_hp = max_hp
+        fighter.fighter.hp = hp
+
+    con = tdl.Console(width, height + PANEL_HEIGHT)
+    root_console = tdl.Console(width, height + PANEL_HEIGHT)
+    panel = tdl.Console(width, PANEL_HEIGHT)
+    damage = DamageTracker(width, height)
+    entities.damage = damage
+
+    def render(full, light_map=None):
+        if full:
+            damage.mark_all()
+        render_all(con, panel, entities, player, game_map, full, root_console, session.message_log, width,
+                   height + PANEL_HEIGHT, 20, PANEL_HEIGHT, height, (player.x, player.y), COLORS, damage, light_map)
+
+    record('render_all_full', lambda: render(True))
+
+    def render_after_enemy_turn():
+        session.play_enemy_turn()
+        render(False)
+
+    # includes the enemy turn that produced the damage; subtract enemy_turn for the render share
+    record('render_all_incremental', render_after_enemy_turn)
+
+    def render_lit_after_enemy_turn():
+        session.play_enemy_turn()
+        render(False, session.light_map)
+
+    # the same with lighting: every turn a glowing monster moves, the light map and the tiles in view are redone
+    record('render_all_lit', render_lit_after_enemy_turn)
+
+    entities.damage = None
+
+    return results
+
+
+def run(args):
+    """
+    Runs the benchmarks and writes the results.
+
+    :param args: argparse.Namespace
+    """
+    scenarios = [scenario for scenario in SCENARIOS
+                 if not args.quick or scenario[0] in QUICK_SCENARIOS]
+
+    results = []
+    for name, width, height, monster_count in scenarios:
+        results.extend(run_scenario(name, width, height, monster_count, args.repeat, args.only))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed': SEED,
+        },
+        'results': results,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print('Results written to {0}'.format(args.output))
+
+
+def compare(args):
+    """
+    Compares two result files and flags benchmarks whose median time grew more than the threshold.
+
+    :param args: argparse.Namespace
+    :return: int (exit code, 1 if there are regressions)
+    """
+    with open(args.old) as f:
+        old = {(result['scenario'], result['name']): result for result in json.load(f)['results']}
+    with open(args.new) as f:
+        new = {(result['scenario'], result['name']): result for result in json.load(f)['results']}
+
+    regressions = 0
+
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]['median'] / old[key]['median'] if old[key]['median'] else float('inf')
+
+        if ratio > 1 + args.threshold:
+            status = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            status = 'faster'
+        else:
+            status = ''
+
+        print('{0:>8} {1:<24} {2:>12.6f} {3:>12.6f} {4:>7.2f}x {5}'.format(
+            key[0], key[1], old[key]['median'], new[key]['median'], ratio, status))
+
+    for key in sorted(old.keys() ^ new.keys()):
+        print('{0:>8} {1:<24} only in {2}'.format(key[0], key[1], args.old if key in old else args.new))
+
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('--quick', action='store_true', help='only run the small scenarios')
+    run_parser.add_argument('--repeat', type=int, default=10, help='timed runs per benchmark')
+    run_parser.add_argument('--output', default='benchmark_results.json', help='where to write results')
+    run_parser.add_argument('--only', nargs='+', help='benchmark names to run')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative slowdown reported as a regression')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        sys.exit(compare(args))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+from collections import OrderedDict
+import os
+import pickle
+import random
+import tempfile
+
+import numpy as np
+
+from entity_index import EntityIndex
+from map_utils import GameMap, Rect, RoomIndex, create_room, create_h_tunnel, create_v_tunnel, place_entities, \
+    place_items
+
+
+class Chunk:
+    def __init__(self, size):
+        """
+        Square piece of the world: its map layers and the entities standing on it while it is outside the
+        loaded window.
+
+        :param size: int
+        """
+        self.walkable = np.zeros((size, size), dtype=bool, order='F')
+        self.transparent = np.zeros((size, size), dtype=bool, order='F')
+        self.explored = np.zeros((size, size), dtype=bool, order='F')
+        self.revision = 0
+        # entities keep world coordinates while they are stored here
+        self.entities = []
+        # first room center, in chunk coordinates
+        self.start = (size // 2, size // 2)
+
+
+def generate_chunk(chunk, size, max_rooms, room_min_size, room_max_size, max_monsters_per_room, colors,
+                   max_room_items, map_rng=random, spawn_rng=random, entity_pool=None):
+    """
+    Fills chunk with rooms, monsters and items. The first room is tunneled to the middle of every chunk edge,
+    where the neighbouring chunks tunnel to as well, so all chunks are connected.
+
+    :param chunk: Chunk
+    :param size: int
+    :param max_rooms: int
+    :param room_min_size: int
+    :param room_max_size: int
+    :param max_monsters_per_room: int
+    :param colors: Palette
+    :param max_room_items: int
+    :param map_rng: random.Random (for the layout, the global generator by default)
+    :param spawn_rng: random.Random (for monsters and items, the global generator by default)
+    :param entity_pool: EntityPool/None (monsters and items are recycled from it if given)
+    """
+    rooms = []
+    room_index = RoomIndex(size, size)
+    entities = EntityIndex()
+
+    for r in range(max_rooms):
+        w = map_rng.randint(room_min_size, room_max_size)
+        h = map_rng.randint(room_min_size, room_max_size)
+        x = map_rng.randint(0, size - w - 1)
+        y = map_rng.randint(0, size - h - 1)
+
+        new_room = Rect(x, y, w, h)
+
+        if room_index.intersects(new_room):
+            continue
+
+        create_room(chunk, new_room)
+        place_entities(new_room, entities, max_monsters_per_room, colors, spawn_rng, entity_pool)
+        place_items(new_room, entities, max_room_items, colors, spawn_rng, entity_pool)
+
+        if rooms:
+            (prev_x, prev_y) = rooms[-1].center()
+            (new_x, new_y) = new_room.center()
+            create_h_tunnel(chunk, prev_x, new_x, prev_y)
+            create_v_tunnel(chunk, prev_y, new_y, new_x)
+
+        rooms.append(new_room)
+        room_index.add(new_room)
+
+    if rooms:
+        chunk.start = rooms[0].center()
+
+    start_x, start_y = chunk.start
+    middle = size // 2
+
+    # gates: west, east, north, south
+    create_h_tunnel(chunk, start_x, 0, start_y)
+    create_v_tunnel(chunk, start_y, middle, 0)
+    create_h_tunnel(chunk, start_x, size - 1, start_y)
+    create_v_tunnel(chunk, start_y, middle, size - 1)
+    create_v_tunnel(chunk, start_y, 0, start_x)
+    create_h_tunnel(chunk, start_x, middle, 0)
+    create_v_tunnel(chunk, start_y, size - 1, start_x)
+    create_h_tunnel(chunk, start_x, middle, size - 1)
+
+    chunk.entities = list(entities)
+    for entity in chunk.entities:
+        entities.remove(entity)
+
+
+class ChunkedWorld:
+    def __init__(self, chunk_size, colors, max_loaded_chunks=64, spill_directory=None, max_rooms=4, room_min_size=6,
+                 room_max_size=10, max_monsters_per_room=3, max_room_items=2, rng=None):
+        """
+        Unbounded world split into chunks that are generated when first needed. At most max_loaded_chunks stay
+        in memory; the least recently used ones are spilled to disk and read back when needed again.
+
+        :param chunk_size: int
+        :param colors: Palette
+        :param max_loaded_chunks: int
+        :param spill_directory: string/None (temporary directory if None)
+        :param max_rooms: int (per chunk)
+        :param room_min_size: int
+        :param room_max_size: int
+        :param max_monsters_per_room: int
+        :param max_room_items: int
+        :param rng: RandomStreams/None (chunks get generators derived from its seed and their coordinates, so the
+                    world is the same whatever order it is explored in; the global generator is used if None)
+        """
+        self.chunk_size = chunk_size
+        self.colors = colors
+        self.max_loaded_chunks = max_loaded_chunks
+        self.spill_directory = spill_directory or tempfile.mkdtemp(prefix='roguelike_chunks_')
+        self.max_rooms = max_rooms
+        self.room_min_size = room_min_size
+        self.room_max_size = room_max_size
+        self.max_monsters_per_room = max_monsters_per_room
+        self.max_room_items = max_room_items
+        self.rng = rng
+        # EntityPool new chunks take their monsters and items from, None to allocate them
+        self.entity_pool = None
+
+        # (chunk_x, chunk_y) -> Chunk, least recently used first
+        self.chunks = OrderedDict()
+        self.spilled = set()
+
+    def get_chunk(self, chunk_x, chunk_y):
+        """
+        Returns chunk, loading it from disk or generating it if it is not in memory.
+
+        :param chunk_x: int
+        :param chunk_y: int
+        :return: Chunk
+        """
+        key = (chunk_x, chunk_y)
+        chunk = self.chunks.get(key)
+
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+
+        if key in self.spilled:
+            chunk = self._load(key)
+        else:
+            chunk = Chunk(self.chunk_size)
+
+            if self.rng is None:
+                map_rng = spawn_rng = random
+            else:
+                map_rng = self.rng.derive('chunk:{0}:{1}:map'.format(chunk_x, chunk_y))
+                spawn_rng = self.rng.derive('chunk:{0}:{1}:spawn'.format(chunk_x, chunk_y))
+
+            generate_chunk(chunk, self.chunk_size, self.max_rooms, self.room_min_size, self.room_max_size,
+                           self.max_monsters_per_room, self.colors, self.max_room_items, map_rng, spawn_rng,
+                           self.entity_pool)
+
+            # move the generated entities to world coordinates
+            for entity in chunk.entities:
+                entity.x += chunk_x * self.chunk_size
+                entity.y += chunk_y * self.chunk_size
+
+        self.chunks[key] = chunk
+
+        return chunk
+
+    def evict(self, keep):
+        """
+        Spills least recently used chunks to disk until at most max_loaded_chunks are in memory.
+
+        :param keep: set<tuple<int>(chunk_x, chunk_y)> (chunks that must stay loaded)
+        """
+        for key in list(self.chunks):
+            if len(self.chunks) <= self.max_loaded_chunks:
+                break
+
+            if key not in keep:
+                self._spill(key, self.chunks.pop(key))
+
+    def _path(self, key):
+        return os.path.join(self.spill_directory, 'chunk_{0}_{1}'.format(*key))
+
+    def _spill(self, key, chunk):
+        path = self._path(key)
+
+        np.savez(path + '.npz', walkable=chunk.walkable, transparent=chunk.transparent, explored=chunk.explored,
+                 start=np.array(chunk.start))
+
+        with open(path + '.entities', 'wb') as f:
+            pickle.dump(chunk.entities, f, pickle.HIGHEST_PROTOCOL)
+
+        self.spilled.add(key)
+
+    def _load(self, key):
+        path = self._path(key)
+        chunk = Chunk(self.chunk_size)
+
+        with np.load(path + '.npz') as layers:
+            chunk.walkable[...] = layers['walkable']
+            chunk.transparent[...] = layers['transparent']
+            chunk.explored[...] = layers['explored']
+            chunk.start = tuple(int(i) for i in layers['start'])
+
+        with open(path + '.entities', 'rb') as f:
+            chunk.entities = pickle.load(f)
+
+        return chunk
+
+
+class ChunkedGameMap(GameMap):
+    def __init__(self, world, width, height, margin):
+        """
+        Window of width x height cells over a ChunkedWorld. The window is an ordinary GameMap, so FOV,
+        pathfinding and rendering work across chunk boundaries unchanged. Entities on it use window coordinates;
+        the window's top left corner is at origin in world coordinates.
+
+        The window is moved to center on the player when they come within margin cells of its edge.
+
+        :param world: ChunkedWorld
+        :param width: int
+        :param height: int
+        :param margin: int
+        """
+        super().__init__(width, height)
+        self.world = world
+        self.margin = margin
+        self.origin = (0, 0)
+        self.loaded = False
+
+    def follow(self, entity, entities):
+        """
+        Moves the window if entity got close to its edge.
+
+        :param entity: Entity
+        :param entities: EntityIndex
+        :return: bool (True if the window moved)
+        """
+        if self.loaded and self.margin <= entity.x < self.width - self.margin and \
+                self.margin <= entity.y < self.height - self.margin:
+            return False
+
+        self.move_window(self.origin[0] + entity.x - self.width // 2, self.origin[1] + entity.y - self.height // 2,
+                         entities)
+
+        return True
+
+    def move_window(self, origin_x, origin_y, entities):
+        """
+        Stores the window back into its chunks and loads the window at a new origin. Entities leaving the window
+        are stored in their chunks, entities of chunks coming into view are added to the index.
+
+        :param origin_x: int
+        :param origin_y: int
+        :param entities: EntityIndex
+        """
+        old_x, old_y = self.origin
+
+        if self.loaded:
+            self._store_layers()
+
+        self.origin = (origin_x, origin_y)
+        self.loaded = True
+        self.revision += 1
+
+        # entities already on the map: shift them, or store them if they fall out of the window
+        for entity in list(entities):
+            world_x = entity.x + old_x
+            world_y = entity.y + old_y
+
+            if self.contains(world_x, world_y):
+                entity.set_position(world_x - origin_x, world_y - origin_y)
+            else:
+                entities.remove(entity)
+                entity.x, entity.y = world_x, world_y
+                self.world.get_chunk(*self.chunk_of(world_x, world_y)).entities.append(entity)
+
+        for (chunk_x, chunk_y), x, y, chunk_slice in self._window_chunks():
+            chunk = self.world.get_chunk(chunk_x, chunk_y)
+
+            window_slice = (slice(x, x + chunk_slice[0].stop - chunk_slice[0].start),
+                            slice(y, y + chunk_slice[1].stop - chunk_slice[1].start))
+            self.walkable[window_slice] = chunk.walkable[chunk_slice]
+            self.transparent[window_slice] = chunk.transparent[chunk_slice]
+            self.explored[window_slice] = chunk.explored[chunk_slice]
+
+            stored = []
+            for entity in chunk.entities:
+                if self.contains(entity.x, entity.y):
+                    entity.x -= origin_x
+                    entity.y -= origin_y
+                    entities.append(entity)
+                else:
+                    stored.append(entity)
+            chunk.entities = stored
+
+        self.world.evict({key for key, x, y, chunk_slice in self._window_chunks()})
+
+    def contains(self, world_x, world_y):
+        """
+        Returns True if world position is inside the window.
+
+        :param world_x: int
+        :param world_y: int
+        :return: bool
+        """
+        return 0 <= world_x - self.origin[0] < self.width and 0 <= world_y - self.origin[1] < self.height
+
+    def chunk_of(self, world_x, world_y):
+        """
+        Returns coordinates of the chunk containing a world position.
+
+        :param world_x: int
+        :param world_y: int
+        :return: tuple<int>(chunk_x, chunk_y)
+        """
+        return world_x // self.world.chunk_size, world_y // self.world.chunk_size
+
+    def _window_chunks(self):
+        """
+        Yields every chunk overlapping the window with the window position and chunk area of the overlap.
+
+        :return: iterator<tuple(tuple<int>(chunk_x, chunk_y), int, int, tuple<slice>)>
+        """
+        size = self.world.chunk_size
+        origin_x, origin_y = self.origin
+
+        first_x, first_y = self.chunk_of(origin_x, origin_y)
+        last_x, last_y = self.chunk_of(origin_x + self.width - 1, origin_y + self.height - 1)
+
+        for chunk_x in range(first_x, last_x + 1):
+            for chunk_y in range(first_y, last_y + 1):
+                x1 = max(chunk_x * size, origin_x)
+                y1 = max(chunk_y * size, origin_y)
+                x2 = min((chunk_x + 1) * size, origin_x + self.width)
+                y2 = min((chunk_y + 1) * size, origin_y + self.height)
+
+                yield ((chunk_x, chunk_y), x1 - origin_x, y1 - origin_y,
+                       (slice(x1 - chunk_x * size, x2 - chunk_x * size),
+                        slice(y1 - chunk_y * size, y2 - chunk_y * size)))
+
+    def _store_layers(self):
+        """
+        Copies the window's layers back into its chunks.
+        """
+        for key, x, y, chunk_slice in self._window_chunks():
+            chunk = self.world.get_chunk(*key)
+
+            window_slice = (slice(x, x + chunk_slice[0].stop - chunk_slice[0].start),
+                            slice(y, y + chunk_slice[1].stop - chunk_slice[1].start))
+            chunk.walkable[chunk_slice] = self.walkable[window_slice]
+            chunk.transparent[chunk_slice] = self.transparent[window_slice]
+            chunk.explored[chunk_slice] = self.explored[window_slice]
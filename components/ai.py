@@ -1,11 +1,14 @@
 class BasicMonster:
-    def take_turn(self, target, game_map, entities):
+    __slots__ = ('owner',)
+
+    def take_turn(self, target, game_map, entities, distance_map):
         """
         AI takes turn.
 
         :param target: Entity
         :param game_map: GameMap
-        :param entities: list<Entity>
+        :param entities: EntityIndex
+        :param distance_map: DistanceMap (towards target)
         :return: array
         """
         results = []
@@ -14,7 +17,10 @@ class BasicMonster:
 
         if game_map.fov[monster.x, monster.y]:
             if monster.distance_to(target) >= 2:
-                monster.move_towards(target.x, target.y, game_map, entities)
+                step = distance_map.get_step(monster.x, monster.y, entities)
+
+                if step:
+                    monster.move(*step)
 
             elif target.fighter.hp > 0:
                 attack_results = monster.fighter.attack(target)
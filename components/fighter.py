@@ -2,18 +2,102 @@ from game_messages import Message
 
 
 class Fighter:
+    __slots__ = ('owner', 'store', 'id', '_hp', '_max_hp', '_defense', '_power')
+
     def __init__(self, hp, defense, power):
         """
         Fighter class. Used for combat.
 
+        Stats are kept on the fighter until it is attached to a FighterStore; from then on it is a view of its
+        slot in the store's arrays.
+
         :param hp: int
         :param defense: int
         :param power: int
         """
-        self.max_hp = hp
-        self.hp = hp
-        self.defense = defense
-        self.power = power
+        self.store = None
+        self.id = None
+        self._max_hp = hp
+        self._hp = hp
+        self._defense = defense
+        self._power = power
+
+    @property
+    def hp(self):
+        if self.store is None:
+            return self._hp
+        return int(self.store.hp[self.id])
+
+    @hp.setter
+    def hp(self, value):
+        if self.store is None:
+            self._hp = value
+        else:
+            self.store.hp[self.id] = value
+
+    @property
+    def max_hp(self):
+        if self.store is None:
+            return self._max_hp
+        return int(self.store.max_hp[self.id])
+
+    @max_hp.setter
+    def max_hp(self, value):
+        if self.store is None:
+            self._max_hp = value
+        else:
+            self.store.max_hp[self.id] = value
+
+    @property
+    def defense(self):
+        if self.store is None:
+            return self._defense
+        return int(self.store.defense[self.id])
+
+    @defense.setter
+    def defense(self, value):
+        if self.store is None:
+            self._defense = value
+        else:
+            self.store.defense[self.id] = value
+
+    @property
+    def power(self):
+        if self.store is None:
+            return self._power
+        return int(self.store.power[self.id])
+
+    @power.setter
+    def power(self, value):
+        if self.store is None:
+            self._power = value
+        else:
+            self.store.power[self.id] = value
+
+    def attach(self, store):
+        """
+        Moves stats into a FighterStore.
+
+        :param store: FighterStore
+        """
+        if self.store is store:
+            return
+
+        self.detach()
+        self.id = store.add(self, self._hp, self._max_hp, self._defense, self._power)
+        self.store = store
+
+    def detach(self):
+        """
+        Copies stats back from the FighterStore and frees the slot.
+        """
+        if self.store is None:
+            return
+
+        self._hp, self._max_hp, self._defense, self._power = self.hp, self.max_hp, self.defense, self.power
+        self.store.remove(self.id)
+        self.store = None
+        self.id = None
 
     def take_damage(self, amount):
         """
@@ -43,11 +127,11 @@ class Fighter:
         damage = self.power - target.fighter.defense
 
         if damage > 0:
-            results.append({'message': Message('{0} attacks {1} for {2} hit points.'.format(
-                self.owner.name.capitalize(), target.name, str(damage)))})
+            results.append({'message': Message('{0} attacks {1} for {2} hit points.',
+                                               args=(self.owner.name.capitalize(), target.name, damage))})
             results.extend(target.fighter.take_damage(damage))
         else:
-            results.append({'message': Message('{0} attacks {1} but does no damage.'.format(
-                self.owner.name.capitalize(), target.name))})
+            results.append({'message': Message('{0} attacks {1} but does no damage.',
+                                               args=(self.owner.name.capitalize(), target.name))})
 
         return results
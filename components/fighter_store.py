@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class FighterStore:
+    def __init__(self, capacity=64):
+        """
+        Fighter stats of many entities in contiguous arrays indexed by fighter id.
+        Fighters attached to the store read and write their stats here, so whole turns of combat can be resolved
+        with array operations.
+
+        :param capacity: int (initial number of slots, grows as needed)
+        """
+        self.hp = np.zeros(capacity, dtype=np.int64)
+        self.max_hp = np.zeros(capacity, dtype=np.int64)
+        self.defense = np.zeros(capacity, dtype=np.int64)
+        self.power = np.zeros(capacity, dtype=np.int64)
+
+        # id -> Fighter, None for free slots
+        self.fighters = []
+        self.free_ids = []
+
+    def __len__(self):
+        return len(self.fighters) - len(self.free_ids)
+
+    def add(self, fighter, hp, max_hp, defense, power):
+        """
+        Takes a slot for fighter, reusing freed ids first.
+
+        :param fighter: Fighter
+        :param hp: int
+        :param max_hp: int
+        :param defense: int
+        :param power: int
+        :return: int (fighter id)
+        """
+        if self.free_ids:
+            fighter_id = self.free_ids.pop()
+            self.fighters[fighter_id] = fighter
+        else:
+            fighter_id = len(self.fighters)
+            self.fighters.append(fighter)
+
+            if fighter_id == len(self.hp):
+                self._grow()
+
+        self.hp[fighter_id] = hp
+        self.max_hp[fighter_id] = max_hp
+        self.defense[fighter_id] = defense
+        self.power[fighter_id] = power
+
+        return fighter_id
+
+    def remove(self, fighter_id):
+        """
+        Frees a slot.
+
+        :param fighter_id: int
+        """
+        self.fighters[fighter_id] = None
+        self.free_ids.append(fighter_id)
+
+    def resolve_attacks(self, attacker_ids, target_ids):
+        """
+        Resolves a batch of attacks in one pass. Attacks happen simultaneously: fighters killed in the batch still
+        deal their own damage.
+
+        :param attacker_ids: sequence<int>
+        :param target_ids: sequence<int>
+        :return: tuple(numpy.ndarray<int> (damage of each attack), set<int> (ids of fighters killed by the batch))
+        """
+        attacker_ids = np.asarray(attacker_ids, dtype=np.intp)
+        target_ids = np.asarray(target_ids, dtype=np.intp)
+
+        damage = np.maximum(self.power[attacker_ids] - self.defense[target_ids], 0)
+
+        targets = np.unique(target_ids)
+        alive_before = self.hp[targets] > 0
+
+        np.subtract.at(self.hp, target_ids, damage)
+
+        dead = targets[alive_before & (self.hp[targets] <= 0)]
+
+        return damage, set(dead.tolist())
+
+    def _grow(self):
+        old_capacity = len(self.hp)
+
+        for name in ('hp', 'max_hp', 'defense', 'power'):
+            array = np.zeros(old_capacity * 2, dtype=np.int64)
+            array[:old_capacity] = getattr(self, name)
+            setattr(self, name, array)
@@ -3,19 +3,22 @@ from game_messages import Message
 
 class Item:
     # an item that can be picked up and used.
-    def pick_up(self, entities, inventory, colors):
+    __slots__ = ('owner',)
+
+    def pick_up(self, entities, inventory, colors, capacity=26):
         """
         Add to the player's inventory and remove from the map.
 
-        :param entities: list<Entity>
+        :param entities: EntityIndex
         :param inventory: array
         :param colors: dict<tuple<int>(r, g, b)>
+        :param capacity: int
         :return: dict<Message>
         """
-        if len(inventory) >= 26:
-            return [{"message": Message('Your inventory is full, cannot pick up {0}.'.format(self.owner.name),
-                                       colors.get("red"))}]
+        if len(inventory) >= capacity:
+            return [{"message": Message('Your inventory is full, cannot pick up {0}.', colors.get("red"),
+                                        args=(self.owner.name,))}]
         else:
             inventory.append(self.owner)
             entities.remove(self.owner)
-            return [{"message": Message('You picked up a {0}!'.format(self.owner.name), colors.get("green"))}]
+            return [{"message": Message('You picked up a {0}!', colors.get("green"), args=(self.owner.name,))}]
@@ -0,0 +1,16 @@
+class Light:
+    __slots__ = ('owner', 'radius', 'color', 'intensity', 'static')
+
+    def __init__(self, radius, color, intensity=1.0, static=False):
+        """
+        Light cast by its owner over the cells the owner can see.
+
+        :param radius: int
+        :param color: tuple<int>(r, g, b)
+        :param intensity: float (1 lights the owner's cell fully)
+        :param static: bool (the owner never moves, so the light is cached with the other static lights)
+        """
+        self.radius = radius
+        self.color = color
+        self.intensity = intensity
+        self.static = static
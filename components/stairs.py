@@ -0,0 +1,10 @@
+class Stairs:
+    __slots__ = ('owner', 'floor')
+
+    def __init__(self, floor):
+        """
+        Stairs leading down to another floor.
+
+        :param floor: int (floor the stairs lead to)
+        """
+        self.floor = floor
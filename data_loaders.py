@@ -0,0 +1,234 @@
+"""
+Save files.
+
+Layout (all integers little endian):
+
+    magic           4 bytes, b'RLSV'
+    version         uint32
+    header length   uint32
+    header          JSON: session state, entities, message log and where each map layer starts, counted from
+                    the first multiple of LAYER_ALIGNMENT after the header
+    map layers      raw bool arrays of width * height bytes in (x, y) Fortran order, each starting at a multiple
+                    of LAYER_ALIGNMENT so that it can be memory-mapped in place
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from components.ai import BasicMonster
+from components.fighter import Fighter
+from components.item import Item
+from components.light import Light
+from components.stairs import Stairs
+from entity import Entity
+from entity_index import EntityIndex
+from game_messages import Message, MessageLog
+from game_session import GameSession
+from game_states import GameStates
+from map_utils import GameMap
+from render_functions import RenderOrder
+from rng import RandomStreams
+
+
+MAGIC = b'RLSV'
+VERSION = 1
+LAYER_ALIGNMENT = 64
+LAYERS = ['walkable', 'transparent', 'explored']
+
+AI_COMPONENTS = {
+    'BasicMonster': BasicMonster,
+}
+
+_PREAMBLE = struct.Struct('<4sII')
+
+
+class SaveFileError(Exception):
+    pass
+
+
+def entity_to_dict(entity):
+    """
+    Converts entity and its components to plain data.
+
+    :param entity: Entity
+    :return: dict
+    """
+    data = {
+        'x': entity.x,
+        'y': entity.y,
+        'char': entity.char,
+        'color': entity.color,
+        'name': entity.name,
+        'blocks': entity.blocks,
+        'render_order': entity.render_order.name,
+        'speed': entity.speed,
+    }
+
+    if entity.fighter:
+        data['fighter'] = {'hp': entity.fighter.hp, 'max_hp': entity.fighter.max_hp,
+                           'defense': entity.fighter.defense, 'power': entity.fighter.power}
+
+    if entity.ai:
+        data['ai'] = type(entity.ai).__name__
+
+    if entity.item:
+        data['item'] = {}
+
+    if entity.stairs:
+        data['stairs'] = {'floor': entity.stairs.floor}
+
+    if entity.light:
+        data['light'] = {'radius': entity.light.radius, 'color': entity.light.color,
+                         'intensity': entity.light.intensity, 'static': entity.light.static}
+
+    return data
+
+
+def entity_from_dict(data, entity_pool=None):
+    """
+    Creates entity and its components from plain data.
+
+    :param data: dict
+    :param entity_pool: EntityPool/None (the entity is recycled from it if given)
+    :return: Entity
+    """
+    fighter = None
+    if 'fighter' in data:
+        fighter = Fighter(hp=data['fighter']['max_hp'], defense=data['fighter']['defense'],
+                          power=data['fighter']['power'])
+        fighter.hp = data['fighter']['hp']
+
+    ai = AI_COMPONENTS[data['ai']]() if 'ai' in data else None
+    item = Item() if 'item' in data else None
+    stairs = Stairs(data['stairs']['floor']) if 'stairs' in data else None
+
+    light = None
+    if 'light' in data:
+        light = Light(data['light']['radius'], tuple(data['light']['color']), data['light']['intensity'],
+                      data['light']['static'])
+
+    spawn = entity_pool.acquire if entity_pool is not None else Entity
+
+    return spawn(data['x'], data['y'], data['char'], data['color'], data['name'], blocks=data['blocks'],
+                 render_order=RenderOrder[data['render_order']], fighter=fighter, ai=ai, item=item,
+                 stairs=stairs, speed=data['speed'], light=light)
+
+
+def save_game(path, session):
+    """
+    Writes session to path. The file is replaced atomically, so a crash while autosaving keeps the previous save.
+
+    :param path: string
+    :param session: GameSession
+    """
+    game_map = session.game_map
+
+    if type(game_map) is not GameMap:
+        raise SaveFileError('Only fixed size maps can be saved.')
+
+    entities = list(session.entities)
+    layer_size = game_map.width * game_map.height
+
+    header = {
+        'width': game_map.width,
+        'height': game_map.height,
+        'game_state': session.game_state.name,
+        'turn': session.turn,
+        'floor': session.floor,
+        'seed': session.rng.seed,
+        'fov': {'algorithm': session.fov_algorithm, 'radius': session.fov_radius,
+                'light_walls': session.fov_light_walls},
+        'player': entities.index(session.player),
+        'entities': [entity_to_dict(entity) for entity in entities],
+        'inventory': [entity_to_dict(entity) for entity in session.inventory],
+        'message_log': {
+            'x': session.message_log.x,
+            'width': session.message_log.width,
+            'height': session.message_log.height,
+            'capacity': session.message_log.messages.maxlen,
+            'messages': [(message.text, message.color) for message in session.message_log.messages],
+        },
+    }
+
+    header['layers'] = {}
+    offset = 0
+
+    for name in LAYERS:
+        header['layers'][name] = offset
+        offset = _align(offset + layer_size)
+
+    encoded_header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    layers_start = _align(_PREAMBLE.size + len(encoded_header))
+
+    temporary_path = path + '.tmp'
+
+    with open(temporary_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(encoded_header)))
+        f.write(encoded_header)
+
+        for name in LAYERS:
+            f.seek(layers_start + header['layers'][name])
+            f.write(getattr(game_map, name).tobytes(order='F'))
+
+    os.replace(temporary_path, path)
+
+
+def load_game(path, colors):
+    """
+    Reads a session saved with save_game. Map layers are memory-mapped instead of parsed.
+
+    :param path: string
+    :param colors: Palette
+    :return: GameSession
+    """
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+
+        if len(preamble) != _PREAMBLE.size:
+            raise SaveFileError('{0} is not a save file.'.format(path))
+
+        magic, version, header_length = _PREAMBLE.unpack(preamble)
+
+        if magic != MAGIC:
+            raise SaveFileError('{0} is not a save file.'.format(path))
+        if version != VERSION:
+            raise SaveFileError('{0} has unsupported version {1}.'.format(path, version))
+
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    width = header['width']
+    height = header['height']
+    layers_start = _align(_PREAMBLE.size + header_length)
+
+    game_map = GameMap(width, height)
+
+    for name in LAYERS:
+        layer = np.memmap(path, dtype=bool, mode='r', offset=layers_start + header['layers'][name],
+                          shape=(width, height), order='F')
+        # walkable and transparent live in libtcod's buffers, so they are copied in one block
+        getattr(game_map, name)[...] = layer
+    game_map.revision += 1
+
+    entities = EntityIndex(entity_from_dict(data) for data in header['entities'])
+    player = list(entities)[header['player']]
+    inventory = [entity_from_dict(data) for data in header['inventory']]
+
+    log = header['message_log']
+    message_log = MessageLog(log['x'], log['width'], log['height'], log['capacity'])
+    for text, color in log['messages']:
+        message_log.add_message(Message(text, tuple(color) if color is not None else None))
+
+    fov = header['fov']
+    session = GameSession(player, entities, game_map, message_log, colors, fov['algorithm'],
+                          fov['radius'], fov['light_walls'], inventory, rng=RandomStreams(header['seed']))
+    session.game_state = GameStates[header['game_state']]
+    session.turn = header['turn']
+    session.floor = header['floor']
+
+    return session
+
+
+def _align(offset):
+    return (offset + LAYER_ALIGNMENT - 1) // LAYER_ALIGNMENT * LAYER_ALIGNMENT
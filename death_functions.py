@@ -8,11 +8,12 @@ def kill_player(player, colors):
     Kills the player.
 
     :param player: Entity
-    :param colors: tuple<int>(r, g, b)
+    :param colors: Palette
     :return: Message
     """
     player.char = '%'
-    player.color = colors.get('dark_red')
+    player.color = colors.id('dark_red')
+    player.mark_dirty()
 
     return Message('You died!', colors.get('red')), GameStates.PLAYER_DEAD
 
@@ -22,17 +23,24 @@ def kill_monster(monster, colors):
     Kills the monster.
 
     :param monster: Entity
-    :param colors: tuple<int>(r, g, b)
+    :param colors: Palette
     :return: Message
     """
-    death_message = Message('{0} is dead!'.format(monster.name.capitalize()), colors.get('orange'))
+    death_message = Message('{0} is dead!', colors.get('orange'), args=(monster.name.capitalize(),))
 
     monster.char = '%'
-    monster.color = colors.get('dark_red')
+    monster.color = colors.id('dark_red')
     monster.blocks = False
+    monster.fighter.detach()
     monster.fighter = None
     monster.ai = None
+    if monster.light:
+        # corpses don't glow
+        if monster.index is not None and monster.index.lights is not None:
+            monster.index.lights.remove(monster.light)
+        monster.light = None
     monster.name = 'remains of ' + monster.name
-    monster.render_order = RenderOrder.CORPSE
+    monster.set_render_order(RenderOrder.CORPSE)
+    monster.mark_dirty()
 
     return death_message
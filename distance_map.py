@@ -0,0 +1,126 @@
+import math
+
+import numpy as np
+
+import instrumentation
+
+
+NEIGHBOURS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+def _shift_slices(dx, dy, width, height):
+    """
+    Returns slices pairing every cell (x, y) with its neighbour (x + dx, y + dy) inside the map.
+
+    :param dx: int
+    :param dy: int
+    :param width: int
+    :param height: int
+    :return: tuple<tuple<slice>>(cells, neighbours)
+    """
+    cells = (slice(max(0, -dx), width - max(0, dx)), slice(max(0, -dy), height - max(0, dy)))
+    neighbours = (slice(max(0, dx), width - max(0, -dx)), slice(max(0, dy), height - max(0, -dy)))
+    return cells, neighbours
+
+
+class DistanceMap:
+    def __init__(self, game_map, max_distance=None, diagonal_cost=math.sqrt(2)):
+        """
+        Dijkstra map holding the walking distance from every cell to a target.
+        Shared by all monsters chasing the same target: one computation per turn instead of an A* search per monster.
+
+        With max_distance set, only the square of that radius around the target is computed, so the cost of an update
+        depends on the radius and not on the size of the map. Cells outside of it are unreachable.
+
+        :param game_map: GameMap
+        :param max_distance: int/None
+        :param diagonal_cost: float
+        """
+        self.game_map = game_map
+        self.max_distance = max_distance
+        self.diagonal_cost = diagonal_cost
+        self.distances = np.full((game_map.width, game_map.height), np.inf, order='F')
+        self.target = None
+        self.window = (slice(0, 0), slice(0, 0))
+        self.walkable = None
+
+    def update(self, target_x, target_y):
+        """
+        Recomputes distances to target. Does nothing if neither the target nor the map changed.
+
+        :param target_x: int
+        :param target_y: int
+        """
+        if self.max_distance is None:
+            window = (slice(0, self.game_map.width), slice(0, self.game_map.height))
+        else:
+            window = (slice(max(0, target_x - self.max_distance), target_x + self.max_distance + 1),
+                      slice(max(0, target_y - self.max_distance), target_y + self.max_distance + 1))
+
+        walkable = self.game_map.walkable[window]
+
+        if self.target == (target_x, target_y) and np.array_equal(self.walkable, walkable):
+            return
+
+        self.distances[self.window] = np.inf
+        self.window = window
+        self.walkable = walkable.copy()
+        self.target = (target_x, target_y)
+
+        distances = self.distances[window]
+        distances[target_x - window[0].start, target_y - window[1].start] = 0
+        self._relax(distances, walkable)
+
+        instrumentation.profiler.count('distance_maps_computed')
+
+    def _relax(self, distances, walkable):
+        """
+        Lowers distances through neighbouring cells until nothing changes.
+
+        :param distances: numpy.ndarray<float>
+        :param walkable: numpy.ndarray<bool>
+        """
+        width, height = distances.shape
+        # walls can never be entered
+        entry_cost = np.where(walkable, 0, np.inf)
+
+        steps = [_shift_slices(dx, dy, width, height) + (1 if dx == 0 or dy == 0 else self.diagonal_cost,)
+                 for dx, dy in NEIGHBOURS]
+
+        changed = True
+        while changed:
+            changed = False
+
+            for cells, neighbours, cost in steps:
+                current = distances[cells]
+                candidate = distances[neighbours] + cost + entry_cost[cells]
+
+                if (candidate < current).any():
+                    np.minimum(current, candidate, out=current)
+                    changed = True
+
+    def get_step(self, x, y, entities):
+        """
+        Returns the move towards the target from a given position, avoiding cells taken by blocking entities.
+        Returns None if no neighbouring cell is closer to the target.
+
+        :param x: int
+        :param y: int
+        :param entities: EntityIndex
+        :return: tuple<int>(dx, dy)/None
+        """
+        width, height = self.distances.shape
+        best_distance = self.distances[x, y]
+        best_step = None
+
+        for dx, dy in NEIGHBOURS:
+            neighbour_x = x + dx
+            neighbour_y = y + dy
+
+            if 0 <= neighbour_x < width and 0 <= neighbour_y < height and \
+                    self.distances[neighbour_x, neighbour_y] < best_distance and \
+                    not entities.get_blocking_entity_at(neighbour_x, neighbour_y):
+                best_distance = self.distances[neighbour_x, neighbour_y]
+                best_step = (dx, dy)
+
+        return best_step
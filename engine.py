@@ -1,16 +1,27 @@
+import argparse
+from collections import deque
+import os
+import time
+
 import tdl
 
-from components.fighter import Fighter
-from death_functions import kill_monster, kill_player
-from entity import Entity, get_blocking_entities_at_location
+from data_loaders import load_game, save_game
 from game_messages import MessageLog
-from game_states import GameStates
-from input_handlers import handle_keys
-from render_functions import clear_all, render_all, RenderOrder, menu
-from map_utils import GameMap, make_map
-
-
-def main():
+from game_session import new_chunked_game, new_game
+from input_handlers import handle_keys, wait_for_events
+from level_generation import LevelPregenerator
+from level_manager import LevelManager
+import instrumentation
+from render_damage import DamageTracker
+from menus import Menu
+from palette import Palette
+from render_functions import render_all
+from replay import Recorder
+import terminal_backend
+
+
+def main(chunked=False, continue_game=False, autosave=False, profile=False, seed=None, record=None, max_fps=30,
+         terminal=False, terminal_colors=2 ** 24):
     screen_width = 80
     screen_height = 50
 
@@ -36,7 +47,15 @@ def main():
     max_monsters_per_room = 3
     max_room_items = 2
 
-    colors = {
+    corpse_lifetime = 200
+
+    # floors the player left are written to disk beyond this
+    level_memory_budget = 32 * 2 ** 20
+
+    chunk_size = 32
+    max_loaded_chunks = 64
+
+    colors = Palette({
         'dark_wall': (0, 0, 100),
         'dark_ground': (50, 50, 150),
         'light_wall': (130, 110, 50),
@@ -51,157 +70,238 @@ def main():
         'light_red': (255, 114, 114),
         'darker_red': (127, 0, 0),
         "violet": (148, 0, 211)
-    }
+    })
 
-    fighter_component = Fighter(hp=30, defense=2, power=5)
-    inventory = []
     inventory_width = 50
-    player = Entity(0, 0, '@', (255, 255, 255), 'Player', render_order=RenderOrder.ACTOR,
-                    blocks=True, fighter=fighter_component)
-    entities = [player]
+    # the inventory menu pages through items 26 at a time
+    inventory_capacity = 260
+
+    save_path = 'savegame.dat'
+    scrollback_path = 'scrollback.log'
+    trace_path = 'profile_trace.json'
+    overlay_width = 37
 
-    tdl.set_font('arial10x10.png', greyscale=True, altLayout=True)
+    # how long to wait for input before checking whether the window was closed
+    idle_timeout = 0.5
+    idle_poll_interval = 0.01
 
-    root_console = tdl.init(screen_width, screen_height, title='Roguelike Tutorial Revised')
+    backend = terminal_backend if terminal else tdl
 
-    con = tdl.Console(screen_width, screen_height)
-    panel = tdl.Console(screen_width, panel_height)
+    backend.set_font('arial10x10.png', greyscale=True, altLayout=True)
 
-    game_map = GameMap(map_width, map_height)
-    make_map(game_map, max_rooms, room_min_size, room_max_size, map_width, map_height, player, entities,
-             max_monsters_per_room, colors, max_room_items)
+    if terminal:
+        root_console = terminal_backend.init(screen_width, screen_height, colors=terminal_colors)
+    else:
+        root_console = tdl.init(screen_width, screen_height, title='Roguelike Tutorial Revised')
 
-    fov_recompute = True
+    con = backend.Console(screen_width, screen_height)
+    panel = backend.Console(screen_width, panel_height)
 
     message_log = MessageLog(message_x, message_width, message_height)
 
-    mouse_coordinates = (0, 0)
+    loaded = continue_game and os.path.exists(save_path)
 
-    game_state = GameStates.PLAYERS_TURN
+    if loaded:
+        session = load_game(save_path, colors)
+        message_log = session.message_log
+    elif chunked:
+        session = new_chunked_game(map_width, map_height, chunk_size, max_loaded_chunks, message_log, colors,
+                                   fov_algorithm, fov_radius, fov_light_walls, seed=seed)
+    else:
+        session = new_game(map_width, map_height, max_rooms, room_min_size, room_max_size, max_monsters_per_room,
+                           max_room_items, message_log, colors, fov_algorithm, fov_radius, fov_light_walls, seed=seed)
+
+    session.corpse_lifetime = corpse_lifetime
+    session.inventory_capacity = inventory_capacity
+    message_log.open_scrollback(scrollback_path)
+
+    settings = {
+        'map_width': map_width, 'map_height': map_height, 'max_rooms': max_rooms,
+        'room_min_size': room_min_size, 'room_max_size': room_max_size,
+        'max_monsters_per_room': max_monsters_per_room, 'max_room_items': max_room_items,
+        'fov_algorithm': fov_algorithm, 'fov_radius': fov_radius, 'fov_light_walls': fov_light_walls,
+        'chunk_size': chunk_size, 'max_loaded_chunks': max_loaded_chunks, 'corpse_lifetime': corpse_lifetime,
+        'inventory_capacity': inventory_capacity,
+    }
 
-    while not tdl.event.is_window_closed():
-        if fov_recompute:
-            game_map.compute_fov(player.x, player.y, fov=fov_algorithm, radius=fov_radius, light_walls=fov_light_walls)
+    pregenerator = None
 
-        render_all(con, panel, entities, player, game_map, fov_recompute, root_console, message_log, screen_width,
-                   screen_height, bar_width, panel_height, panel_y, mouse_coordinates, colors)
-        tdl.flush()
+    # the chunked world has no stairs
+    if loaded or not chunked:
+        pregenerator = LevelPregenerator(settings, colors, session.rng.seed, entity_pool=session.entity_pool)
+        pregenerator.request(session.floor + 1)
+        session.level_source = pregenerator.get_level
+        session.levels = LevelManager(level_memory_budget, entity_pool=session.entity_pool)
 
-        clear_all(con, entities)
+    recorder = None
 
-        fov_recompute = False
+    # a replay starts from the seed, so only new games can be recorded
+    if record and not loaded:
+        recorder = Recorder(record, {'seed': session.rng.seed, 'chunked': chunked, 'settings': settings,
+                                     'colors': colors, 'message_log': [message_x, message_width, message_height]})
 
-        for event in tdl.event.get():
-            if event.type == 'KEYDOWN':
-                user_input = event
-                break
-            elif event.type == 'MOUSEMOTION':
-                mouse_coordinates = event.cell
-        else:
-            user_input = None
+    damage = DamageTracker(session.game_map.width, session.game_map.height)
+    session.entities.damage = damage
 
-        if not user_input:
-            continue
+    # the chunked world lives in its spill directory and is not saved
+    can_save = not chunked
 
-        action = handle_keys(user_input)
+    if profile:
+        instrumentation.enable(trace=True)
 
-        move = action.get('move')
-        exit = action.get('exit')
-        fullscreen = action.get('fullscreen')
-        pickup = action.get('pickup')
-        open_inventory = action.get('inventory')
+    profiler = instrumentation.profiler
 
-        player_turn_results = []
+    mouse_coordinates = (0, 0)
 
-        if move and game_state == GameStates.PLAYERS_TURN:
-            dx, dy = move
-            destination_x = player.x + dx
-            destination_y = player.y + dy
+    inventory_window = Menu('Inventory', inventory_width, screen_width, screen_height, colors, backend=backend)
 
-            if game_map.walkable[destination_x, destination_y]:
-                target = get_blocking_entities_at_location(entities, destination_x, destination_y)
+    frame_time = 1 / max_fps
+    last_frame = 0
+    needs_render = True
+    # input events not handled yet
+    events = deque()
 
-                if target:
-                    attack_results = player.fighter.attack(target)
-                    player_turn_results.extend(attack_results)
-                else:
-                    player.move(dx, dy)
+    while not backend.event.is_window_closed():
+        # draw at most max_fps frames per second, and only when something changed
+        if needs_render and time.perf_counter() - last_frame >= frame_time:
+            profiler.end_frame()
+            last_frame = time.perf_counter()
 
-                    fov_recompute = True
+            fov_recompute = session.update_fov()
 
-                game_state = GameStates.ENEMY_TURN
+            with profiler.phase('render_all'):
+                render_all(con, panel, session.entities, session.player, session.game_map, fov_recompute,
+                           root_console, message_log, screen_width, screen_height, bar_width, panel_height, panel_y,
+                           mouse_coordinates, colors, damage, session.light_map)
 
-        if pickup and game_state == GameStates.PLAYERS_TURN:
-            # pick up an item
-            for entity in entities:  # look for an item in the player's tile
-                if entity.x == player.x and entity.y == player.y and entity.item:
-                    pickup_results = entity.item.pick_up(entities, inventory, colors)
-                    player_turn_results.extend(pickup_results)
-                    break
-            game_state = GameStates.ENEMY_TURN
+            if profile:
+                overlay_lines = instrumentation.render_overlay(root_console, profiler, 0, 0, overlay_width, colors)
+                # the overlay covers map cells, which have to be redrawn once it shrinks or goes away
+                damage.cells[:overlay_width, :overlay_lines] = True
 
-        if open_inventory:
-            inventory_menu(root_console, "Inventory", inventory, inventory_width, screen_height, screen_width, colors,
-                           mouse_coordinates)
+            with profiler.phase('flush'):
+                backend.flush()
 
-        if exit:
-            return True
+            if terminal:
+                profiler.count('terminal_bytes', terminal_backend.terminal.bytes_written)
 
-        if fullscreen:
-            tdl.set_fullscreen(not tdl.get_fullscreen())
+            # the overlay shows live timings, so it keeps redrawing at the frame cap
+            needs_render = profile
 
-        for player_turn_result in player_turn_results:
-            message = player_turn_result.get('message')
-            dead_entity = player_turn_result.get('dead')
+        if needs_render:
+            timeout = max(0, last_frame + frame_time - time.perf_counter())
+        else:
+            timeout = idle_timeout
 
-            if message:
-                message_log.add_message(message)
+        user_input = None
 
-            if dead_entity:
-                if dead_entity == player:
-                    message, game_state = kill_player(dead_entity, colors)
-                else:
-                    message = kill_monster(dead_entity, colors)
+        # one key per pass; keys typed ahead wait in events for the next ones
+        wait_for_events(events, timeout, idle_poll_interval, backend)
 
-                message_log.add_message(message)
+        while events:
+            event = events.popleft()
 
-        if game_state == GameStates.ENEMY_TURN:
-            for entity in entities:
-                if entity.ai:
-                    enemy_turn_results = entity.ai.take_turn(player, game_map, entities)
+            if event.type == 'KEYDOWN':
+                user_input = event
+                break
+            elif event.type == 'MOUSEMOTION' and event.cell != mouse_coordinates:
+                # hover info follows the mouse
+                mouse_coordinates = event.cell
+                needs_render = True
 
-                    for enemy_turn_result in enemy_turn_results:
-                        message = enemy_turn_result.get('message')
-                        dead_entity = enemy_turn_result.get('dead')
+        if not user_input:
+            continue
 
-                        if message:
-                            message_log.add_message(message)
+        needs_render = True
 
-                        if dead_entity:
-                            if dead_entity == player:
-                                message, game_state = kill_player(dead_entity, colors)
-                            else:
-                                message = kill_monster(dead_entity, colors)
+        with profiler.phase('input'):
+            action = handle_keys(user_input)
 
-                            message_log.add_message(message)
+        if not action:
+            continue
 
-                            if game_state == GameStates.PLAYER_DEAD:
-                                break
+        exit = action.get('exit')
+        fullscreen = action.get('fullscreen')
+        open_inventory = action.get('inventory')
+
+        turn_taken = session.take_action(action)
+
+        if recorder:
+            recorder.record(session, action, turn_taken)
 
-                    if game_state == GameStates.PLAYER_DEAD:
-                        break
-            else:
-                game_state = GameStates.PLAYERS_TURN
+        if turn_taken and autosave and can_save:
+            save_game(save_path, session)
 
+        if session.map_moved:
+            # after descending the level has a new entity index
+            session.entities.damage = damage
+            damage.mark_all()
+            session.map_moved = False
 
-def inventory_menu(root_console, header, inventory, inventory_width, screen_height, screen_width, colors, mouse_coordinates):
-    # show a menu with each item of the inventory as an option
+        if open_inventory:
+            inventory_menu(root_console, inventory_window, session.inventory, idle_timeout, idle_poll_interval,
+                           events)
+            # the menu was drawn straight onto the root console
+            damage.mark_all()
+
+        if exit:
+            break
+
+        if fullscreen:
+            backend.set_fullscreen(not backend.get_fullscreen())
+
+    # escape and closing the window both quit the game
+    if can_save:
+        save_game(save_path, session)
+    message_log.close()
+    if recorder:
+        recorder.close(session)
+    if pregenerator:
+        pregenerator.shutdown()
+    if profile:
+        profiler.write_trace(trace_path)
+
+    return True
+
+
+def inventory_menu(root_console, inventory_window, inventory, timeout, poll_interval, events=None):
+    """
+    Shows the inventory until an item is chosen or the menu is closed.
+
+    :param root_console: tdl.Console
+    :param inventory_window: Menu
+    :param inventory: list<Entity>
+    :param timeout: float (seconds)
+    :param poll_interval: float (seconds)
+    :param events: collections.deque/None (events not handled yet)
+    :return: Entity/None (chosen item)
+    """
     if len(inventory) == 0:
-        options = ['Inventory is empty.']
-    else:
-        options = [item.name for item in inventory]
+        inventory_window.set_options(['Inventory is empty.'])
+        inventory_window.run(root_console, timeout, poll_interval, events)
+        return None
+
+    inventory_window.set_options([item.name for item in inventory])
+    index = inventory_window.run(root_console, timeout, poll_interval, events)
+
+    return inventory[index] if index is not None else None
 
-    index = menu(root_console, header, options, inventory_width, screen_height, screen_width, colors, mouse_coordinates)
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Roguelike Tutorial Revised')
+    parser.add_argument('--chunked', action='store_true', help='play in an unbounded world generated chunk by chunk')
+    parser.add_argument('--continue', dest='continue_game', action='store_true', help='continue the saved game')
+    parser.add_argument('--autosave', action='store_true', help='save after every turn')
+    parser.add_argument('--profile', action='store_true',
+                        help='show frame timings and write a Chrome trace to profile_trace.json on exit')
+    parser.add_argument('--seed', type=int, help='seed of the new game')
+    parser.add_argument('--record', metavar='FILE', help='record the game for replay.py')
+    parser.add_argument('--max-fps', type=int, default=30, help='frame rate cap')
+    parser.add_argument('--terminal', action='store_true', help='play in the text terminal instead of a window')
+    parser.add_argument('--256-colors', dest='terminal_colors', action='store_const', const=256, default=2 ** 24,
+                        help='send 256 color escape sequences in the terminal, for slow links and older terminals')
+    args = parser.parse_args()
+
+    main(chunked=args.chunked, continue_game=args.continue_game, autosave=args.autosave, profile=args.profile,
+         seed=args.seed, record=args.record, max_fps=args.max_fps, terminal=args.terminal,
+         terminal_colors=args.terminal_colors)
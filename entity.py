@@ -1,23 +1,33 @@
 import math
 
+import instrumentation
+
 from render_functions import RenderOrder
+from turn_scheduler import NORMAL_SPEED
 
 
 class Entity:
+    __slots__ = ('x', 'y', 'char', 'color', 'name', 'blocks', 'render_order', 'fighter', 'ai', 'item', 'stairs',
+                 'speed', 'light', 'index')
+
     def __init__(self, x, y, char, color, name, blocks=False, render_order=RenderOrder.CORPSE, fighter=None, ai=None,
-                 item=None):
+                 item=None, stairs=None, speed=NORMAL_SPEED, light=None):
         """
         Entity class.
 
         :param x: int
         :param y: int
         :param char: string
-        :param color: tuple<int>(r, g, b)
+        :param color: int (Palette id)
         :param name: string
         :param blocks: bool
         :param render_order: RenderOrder
         :param fighter: class
         :param ai: class
+        :param item: Item
+        :param stairs: Stairs
+        :param speed: int (NORMAL_SPEED acts once per player turn)
+        :param light: Light
         """
         self.x = x
         self.y = y
@@ -26,10 +36,13 @@ class Entity:
         self.name = name
         self.blocks = blocks
         self.render_order = render_order
-        self.components = []
         self.fighter = fighter
         self.ai = ai
         self.item = item
+        self.stairs = stairs
+        self.speed = speed
+        self.light = light
+        self.index = None
 
         # let the components know who owns it
         if self.fighter:
@@ -41,6 +54,12 @@ class Entity:
         if self.item:
             self.item.owner = self
 
+        if self.stairs:
+            self.stairs.owner = self
+
+        if self.light:
+            self.light.owner = self
+
     def has_component(self, component):
         """
         Returns True if entity has component.
@@ -48,7 +67,8 @@ class Entity:
         :param component: class
         :return: bool
         """
-        return component.name in self.components
+        return any(isinstance(owned, component) for owned in (self.fighter, self.ai, self.item, self.stairs,
+                                                              self.light))
 
     def move(self, dx, dy):
         """
@@ -57,8 +77,41 @@ class Entity:
         :param dx: int
         :param dy: int
         """
-        self.x += dx
-        self.y += dy
+        self.set_position(self.x + dx, self.y + dy)
+
+    def set_position(self, x, y):
+        """
+        Places the entity at a given position and keeps the entity index up to date.
+
+        :param x: int
+        :param y: int
+        """
+        old_x, old_y = self.x, self.y
+
+        self.x = x
+        self.y = y
+
+        if self.index is not None:
+            self.index.update_position(self, old_x, old_y)
+
+    def set_render_order(self, render_order):
+        """
+        Changes the layer the entity is drawn in and keeps the entity index up to date.
+
+        :param render_order: RenderOrder
+        """
+        old_render_order = self.render_order
+        self.render_order = render_order
+
+        if self.index is not None and old_render_order is not render_order:
+            self.index.update_render_order(self, old_render_order)
+
+    def mark_dirty(self):
+        """
+        Flags the entity's cell for redrawing after its appearance changed.
+        """
+        if self.index is not None:
+            self.index.mark_dirty(self.x, self.y)
 
     def move_towards(self, target_x, target_y, game_map, entities):
         """
@@ -67,9 +120,10 @@ class Entity:
         :param target_x: int
         :param target_y: int
         :param game_map: GameMap
-        :param entities: list<Entity>
+        :param entities: EntityIndex
         """
         path = game_map.compute_path(self.x, self.y, target_x, target_y)
+        instrumentation.profiler.count('paths_computed')
 
         dx = path[0][0] - self.x
         dy = path[0][1] - self.y
@@ -94,13 +148,9 @@ def get_blocking_entities_at_location(entities, destination_x, destination_y):
     """
     Gets blocking entities at location. Returns None if no entities were found.
 
-    :param entities: list<Entity>
+    :param entities: EntityIndex
     :param destination_x: int
     :param destination_y: int
     :return: Entity/None
     """
-    for entity in entities:
-        if entity.blocks and entity.x == destination_x and entity.y == destination_y:
-            return entity
-
-    return None
+    return entities.get_blocking_entity_at(destination_x, destination_y)
@@ -0,0 +1,203 @@
+from render_functions import RenderOrder
+
+
+class EntityIndex:
+    def __init__(self, entities=()):
+        """
+        Collection of entities bucketed by map cell. Positional queries cost O(1)
+        instead of a scan over every entity on the level.
+
+        Iterates in insertion order, like the plain list it replaces. Entities are also kept in one layer per
+        RenderOrder, and every cell's bucket is kept in render order, so drawing never has to sort.
+
+        :param entities: iterable<Entity>
+        """
+        # dicts keep insertion order and give O(1) removal
+        self.entities = {}
+        self.cells = {}
+        # RenderOrder -> entities in that layer, in insertion order
+        self.layers = {render_order: {} for render_order in RenderOrder}
+        # DamageTracker notified about cells that need redrawing
+        self.damage = None
+        # FighterStore holding the stats of fighters on the map
+        self.fighters = None
+        # ActivationManager that puts actors to sleep when they leave the map; actors start out dormant
+        self.activation = None
+        # LightMap the lights of entities on the map shine on
+        self.lights = None
+
+        for entity in entities:
+            self.append(entity)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __contains__(self, entity):
+        return entity in self.entities
+
+    def append(self, entity):
+        """
+        Adds entity to the index.
+
+        :param entity: Entity
+        """
+        self.entities[entity] = None
+        self.layers[entity.render_order][entity] = None
+        self._add_to_cell(entity)
+        entity.index = self
+        self.mark_dirty(entity.x, entity.y)
+
+        if self.fighters is not None and entity.fighter:
+            entity.fighter.attach(self.fighters)
+
+        if self.lights is not None and entity.light:
+            self.lights.add(entity.light)
+
+    def remove(self, entity):
+        """
+        Removes entity from the index.
+
+        :param entity: Entity
+        """
+        del self.entities[entity]
+        del self.layers[entity.render_order][entity]
+        self._remove_from_cell(entity, entity.x, entity.y)
+        entity.index = None
+        self.mark_dirty(entity.x, entity.y)
+
+        if entity.fighter:
+            entity.fighter.detach()
+
+        if self.lights is not None and entity.light:
+            self.lights.remove(entity.light)
+
+        if self.activation is not None:
+            self.activation.sleep(entity)
+
+    def attach_fighters(self, store):
+        """
+        Keeps the stats of every fighter on the map, and of fighters added later, in store.
+
+        :param store: FighterStore
+        """
+        self.fighters = store
+
+        for entity in self.entities:
+            if entity.fighter:
+                entity.fighter.attach(store)
+
+    def attach_lights(self, light_map):
+        """
+        Adds the light of every entity on the map, and of entities added later, to light_map.
+
+        :param light_map: LightMap
+        """
+        self.lights = light_map
+
+        for entity in self.entities:
+            if entity.light:
+                light_map.add(entity.light)
+
+    def update_position(self, entity, old_x, old_y):
+        """
+        Moves entity to the bucket of its current position. Called by Entity when it changes position.
+
+        :param entity: Entity
+        :param old_x: int
+        :param old_y: int
+        """
+        self._remove_from_cell(entity, old_x, old_y)
+        self._add_to_cell(entity)
+        self.mark_dirty(old_x, old_y)
+        self.mark_dirty(entity.x, entity.y)
+
+    def update_render_order(self, entity, old_render_order):
+        """
+        Moves entity to the layer of its current render order. Called by Entity when its render order changes.
+
+        :param entity: Entity
+        :param old_render_order: RenderOrder
+        """
+        del self.layers[old_render_order][entity]
+        self.layers[entity.render_order][entity] = None
+
+        self._remove_from_cell(entity, entity.x, entity.y)
+        self._add_to_cell(entity)
+        self.mark_dirty(entity.x, entity.y)
+
+    def mark_dirty(self, x, y):
+        """
+        Reports a cell whose entities changed to the damage tracker, if any.
+
+        :param x: int
+        :param y: int
+        """
+        if self.damage is not None:
+            self.damage.mark_cell(x, y)
+
+    def get_entities_at(self, x, y):
+        """
+        Returns entities standing at location, in render order.
+
+        :param x: int
+        :param y: int
+        :return: list<Entity>
+        """
+        return self.cells.get((x, y), [])
+
+    def get_visible_in_render_order(self, fov, visible_cells):
+        """
+        Yields entities in field of view, layer by layer from the bottom up. Each layer is either scanned or
+        looked up cell by cell, whichever visits fewer entries.
+
+        :param fov: numpy.ndarray<bool>
+        :param visible_cells: list<tuple<int>(x, y)> (cells set in fov)
+        :return: iterator<Entity>
+        """
+        for render_order in RenderOrder:
+            layer = self.layers[render_order]
+
+            if len(layer) <= len(visible_cells):
+                for entity in layer:
+                    if fov[entity.x, entity.y]:
+                        yield entity
+            else:
+                for position in visible_cells:
+                    for entity in self.cells.get(position, ()):
+                        if entity.render_order is render_order:
+                            yield entity
+
+    def get_blocking_entity_at(self, x, y):
+        """
+        Returns blocking entity standing at location or None.
+
+        :param x: int
+        :param y: int
+        :return: Entity/None
+        """
+        for entity in self.cells.get((x, y), ()):
+            if entity.blocks:
+                return entity
+
+        return None
+
+    def _add_to_cell(self, entity):
+        cell = self.cells.setdefault((entity.x, entity.y), [])
+
+        # keep the bucket in render order; buckets rarely hold more than a couple of entities
+        position = len(cell)
+        while position > 0 and cell[position - 1].render_order.value > entity.render_order.value:
+            position -= 1
+
+        cell.insert(position, entity)
+
+    def _remove_from_cell(self, entity, x, y):
+        cell = self.cells[(x, y)]
+        cell.remove(entity)
+
+        # drop empty buckets so the dict only holds occupied cells
+        if not cell:
+            del self.cells[(x, y)]
@@ -0,0 +1,64 @@
+from entity import Entity
+from render_functions import RenderOrder
+from turn_scheduler import NORMAL_SPEED
+
+
+class EntityPool:
+    def __init__(self, max_size=1024):
+        """
+        Free list of despawned entities. Spawning reuses them instead of allocating new objects, which keeps the
+        garbage collector quiet in long sessions where monsters keep dying and spawning.
+
+        :param max_size: int (released entities beyond this are left to the garbage collector)
+        """
+        self.free = []
+        self.max_size = max_size
+
+    def __len__(self):
+        return len(self.free)
+
+    def acquire(self, x, y, char, color, name, blocks=False, render_order=RenderOrder.CORPSE, fighter=None, ai=None,
+                item=None, stairs=None, speed=NORMAL_SPEED, light=None):
+        """
+        Returns an entity, recycled if possible. Takes the same arguments as Entity.
+
+        :param x: int
+        :param y: int
+        :param char: string
+        :param color: int (Palette id)
+        :param name: string
+        :param blocks: bool
+        :param render_order: RenderOrder
+        :param fighter: Fighter
+        :param ai: class
+        :param item: Item
+        :param stairs: Stairs
+        :param speed: int
+        :param light: Light
+        :return: Entity
+        """
+        if not self.free:
+            return Entity(x, y, char, color, name, blocks, render_order, fighter, ai, item, stairs, speed, light)
+
+        entity = self.free.pop()
+        entity.__init__(x, y, char, color, name, blocks, render_order, fighter, ai, item, stairs, speed, light)
+
+        return entity
+
+    def release(self, entity):
+        """
+        Takes entity off the map and keeps it for reuse. Its components are dropped, so their fighter ids are freed
+        in the FighterStore.
+
+        :param entity: Entity
+        """
+        if entity.index is not None:
+            entity.index.remove(entity)
+
+        if len(self.free) < self.max_size:
+            entity.fighter = None
+            entity.ai = None
+            entity.item = None
+            entity.stairs = None
+            entity.light = None
+            self.free.append(entity)
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FovCache:
+    def __init__(self, max_size=256):
+        """
+        Least recently used cache of field of view results. Entries are keyed by position, FOV parameters and the
+        map revision, so any change to the map's transparency invalidates them. Only the square the radius can
+        reach is stored, bit packed.
+
+        :param max_size: int (number of results kept)
+        """
+        self.max_size = max_size
+        # key -> (window slices, window shape, packed bits), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def compute_fov(self, game_map, x, y, fov='BASIC', radius=10, light_walls=True):
+        """
+        Sets game_map.fov to the field of view from a position, computing it only if it is not cached.
+
+        :param game_map: GameMap
+        :param x: int
+        :param y: int
+        :param fov: string (algorithm)
+        :param radius: int (0 or None for unlimited)
+        :param light_walls: bool
+        """
+        key = (x, y, radius, fov, light_walls, game_map.revision)
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+            window, shape, bits = entry
+            game_map.fov[...] = False
+            game_map.fov[window] = np.unpackbits(bits, count=shape[0] * shape[1]).reshape(shape).view(bool)
+            return
+
+        self.misses += 1
+        game_map.compute_fov(x, y, fov=fov, radius=radius, light_walls=light_walls)
+
+        window = _fov_window(game_map, x, y, radius)
+        visible = game_map.fov[window]
+        self.entries[key] = (window, visible.shape, np.packbits(visible, axis=None))
+
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_visible(self, game_map, x, y, fov='BASIC', radius=10, light_walls=True):
+        """
+        Returns the field of view from a position without changing game_map.fov, e.g. for a light source.
+
+        :param game_map: GameMap
+        :param x: int
+        :param y: int
+        :param fov: string (algorithm)
+        :param radius: int (0 or None for unlimited)
+        :param light_walls: bool
+        :return: tuple(tuple<slice> (window of the map the radius reaches), numpy.ndarray<bool> (visible cells in it))
+        """
+        key = (x, y, radius, fov, light_walls, game_map.revision)
+
+        if key not in self.entries:
+            player_fov = game_map.fov.copy()
+            self.compute_fov(game_map, x, y, fov, radius, light_walls)
+            game_map.fov[...] = player_fov
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        window, shape, bits = self.entries[key]
+
+        return window, np.unpackbits(bits, count=shape[0] * shape[1]).reshape(shape).view(bool)
+
+    def clear(self):
+        """
+        Drops every cached result and resets the counters.
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def _fov_window(game_map, x, y, radius):
+    if not radius:
+        return slice(None), slice(None)
+
+    return (slice(max(0, x - radius), min(game_map.width, x + radius + 1)),
+            slice(max(0, y - radius), min(game_map.height, y + radius + 1)))
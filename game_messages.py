@@ -1,31 +1,57 @@
+from collections import deque
+import json
 import textwrap
 
 
 class Message:
-    def __init__(self, text, color=(255, 255, 255)):
+    __slots__ = ('template', 'args', 'color', '_text')
+
+    def __init__(self, text, color=(255, 255, 255), args=()):
         """
-        Colored string.
+        Colored string. The text is only formatted when it is read, so messages that are never shown cost no
+        string formatting.
 
-        :param text: string
+        :param text: string (format template when args are given)
         :param color: tuple<int>(r, g, b)
+        :param args: tuple (arguments for the template)
         """
-        self.text = text
+        self.template = text
+        self.args = args
         self.color = color
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.template.format(*self.args) if self.args else self.template
+
+        return self._text
 
 
 class MessageLog:
-    def __init__(self, x, width, height):
+    def __init__(self, x, width, height, capacity=None):
         """
-        List of Messages.
+        Ring buffer of the latest Messages. Messages are wrapped into lines only when the log is displayed.
+        The complete history can be streamed to a scrollback file, see open_scrollback.
 
         :param x: int
         :param width: int
         :param height: int
+        :param capacity: int/None (messages kept in memory, height if None)
         """
-        self.messages = []
+        self.messages = deque(maxlen=capacity or height)
         self.x = x
         self.width = width
         self.height = height
+        # bumped on every change so renderers can tell when to redraw the log
+        self.revision = 0
+
+        self.scrollback = None
+        # messages not yet written to the scrollback file
+        self.pending = []
+
+        self._lines = []
+        self._lines_revision = 0
 
     def add_message(self, message):
         """
@@ -33,13 +59,78 @@ class MessageLog:
 
         :param message: Message
         """
-        # Split the message if necessary, among multiple lines
-        new_msg_lines = textwrap.wrap(message.text, self.width)
+        self.messages.append(message)
+        self.revision += 1
+
+        if self.scrollback is not None:
+            self.pending.append(message)
+
+    def get_lines(self):
+        """
+        Returns the lines to display: the newest messages wrapped to the log's width, at most height lines.
+
+        :return: list<tuple(string, tuple<int>(r, g, b))>
+        """
+        if self._lines_revision == self.revision:
+            return self._lines
+
+        lines = []
+
+        # wrap from the newest message back until the log is full
+        for message in reversed(self.messages):
+            wrapped = textwrap.wrap(message.text, self.width)
+            lines[:0] = [(line, message.color) for line in wrapped]
+
+            if len(lines) >= self.height:
+                break
+
+        self._lines = lines[-self.height:]
+        self._lines_revision = self.revision
+
+        return self._lines
+
+    def open_scrollback(self, path):
+        """
+        Appends every message added from now on to a file. Messages are written in batches by flush, as their
+        template and arguments, so writing them doesn't format them; read_scrollback turns them back into text.
+
+        :param path: string
+        """
+        self.close()
+        self.scrollback = open(path, 'a', encoding='utf-8')
+
+    def flush(self):
+        """
+        Writes pending messages to the scrollback file.
+        """
+        if self.scrollback is None or not self.pending:
+            return
+
+        self.scrollback.write(''.join(json.dumps([message.template, message.args], separators=(',', ':')) + '\n'
+                                      for message in self.pending))
+        self.scrollback.flush()
+        self.pending = []
+
+    def close(self):
+        """
+        Flushes and closes the scrollback file.
+        """
+        if self.scrollback is None:
+            return
+
+        self.flush()
+        self.scrollback.close()
+        self.scrollback = None
+
 
-        for line in new_msg_lines:
-            # If the buffer is full, remove the first line to make room for the new one
-            if len(self.messages) == self.height:
-                del self.messages[0]
+def read_scrollback(path):
+    """
+    Reads a scrollback file written by MessageLog.
 
-            # Add the new line as a Message object, with the text and the color
-            self.messages.append(message)
+    :param path: string
+    :return: generator<string> (message texts, oldest first)
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            template, args = json.loads(line)
+            yield Message(template, args=args).text
@@ -0,0 +1,397 @@
+from collections import deque
+
+from activation import ActivationManager
+from chunked_map import ChunkedGameMap, ChunkedWorld
+from components.fighter import Fighter
+from components.fighter_store import FighterStore
+from components.light import Light
+from death_functions import kill_monster, kill_player
+from distance_map import DistanceMap
+from entity import Entity, get_blocking_entities_at_location
+from entity_index import EntityIndex
+from entity_pool import EntityPool
+from fov_cache import FovCache
+from game_messages import Message
+from game_states import GameStates
+import instrumentation
+from lighting import LightMap
+from map_utils import GameMap, make_map
+from render_functions import RenderOrder
+from rng import RandomStreams, level_seed
+from turn_scheduler import TurnScheduler, action_delay
+
+
+class GameSession:
+    def __init__(self, player, entities, game_map, message_log, colors, fov_algorithm='BASIC', fov_radius=10,
+                 fov_light_walls=True, inventory=None, corpse_lifetime=None, rng=None, inventory_capacity=26):
+        """
+        Game state and turn logic, independent of any window or input library.
+        Front ends feed it actions and read its state to draw it.
+
+        :param player: Entity
+        :param entities: EntityIndex
+        :param game_map: GameMap
+        :param message_log: MessageLog
+        :param colors: Palette
+        :param fov_algorithm: string
+        :param fov_radius: int
+        :param fov_light_walls: bool
+        :param inventory: list<Entity>
+        :param corpse_lifetime: int/None (turns until a corpse decays, None to keep corpses forever)
+        :param rng: RandomStreams/None (freshly seeded if None)
+        :param inventory_capacity: int
+        """
+        self.player = player
+        self.message_log = message_log
+        self.colors = colors
+        self.fov_algorithm = fov_algorithm
+        self.fov_radius = fov_radius
+        self.fov_light_walls = fov_light_walls
+        self.inventory = inventory if inventory is not None else []
+        self.inventory_capacity = inventory_capacity
+        self.corpse_lifetime = corpse_lifetime
+        self.rng = rng if rng is not None else RandomStreams()
+
+        self.game_state = GameStates.PLAYERS_TURN
+        # set when the map moved its window or was replaced; front ends reset it after redrawing everything
+        self.map_moved = False
+        self.turn = 0
+        self.floor = 1
+        # callable returning the level of a floor as (GameMap, EntityIndex, (x, y)), or None if it isn't ready
+        self.level_source = None
+        # LevelManager keeping the floors the player left, None to forget them
+        self.levels = None
+
+        self.entity_pool = EntityPool()
+
+        self.set_level(game_map, entities)
+
+    def set_level(self, game_map, entities):
+        """
+        Makes game_map and entities the current level. Everything derived from the previous level is dropped.
+
+        :param game_map: GameMap
+        :param entities: EntityIndex (including the player)
+        """
+        self.game_map = game_map
+        self.entities = entities
+        self.fov_recompute = True
+
+        # monsters only act while in view, so paths rarely need to leave twice the view radius
+        self.distance_map = DistanceMap(game_map, max_distance=self.fov_radius * 2)
+        self.fov_cache = FovCache()
+        self.light_map = LightMap(game_map, self.fov_cache, self.fov_algorithm, self.fov_light_walls)
+        entities.attach_lights(self.light_map)
+
+        self.fighters = FighterStore()
+        entities.attach_fighters(self.fighters)
+
+        self.scheduler = TurnScheduler()
+        # only awake monsters are scheduled
+        self.activation = ActivationManager(entities, self.scheduler)
+        entities.activation = self.activation
+
+        # (turn of death, corpse), oldest first
+        self.corpses = deque()
+
+    def update_fov(self):
+        """
+        Recomputes the player's field of view if the player moved since the last call.
+
+        :return: bool (True if it was recomputed)
+        """
+        if not self.fov_recompute:
+            return False
+
+        with instrumentation.profiler.phase('fov'):
+            self.fov_cache.compute_fov(self.game_map, self.player.x, self.player.y, fov=self.fov_algorithm,
+                                       radius=self.fov_radius, light_walls=self.fov_light_walls)
+            self.fov_recompute = False
+
+            self.activation.wake_near_player(self.player, self.game_map.fov, self.fov_radius)
+
+        return True
+
+    def take_action(self, action):
+        """
+        Resolves a player action and, if it took the player's turn, the enemy turn after it.
+
+        :param action: dict (as returned by handle_keys)
+        :return: bool (True if the action took a turn)
+        """
+        self.update_fov()
+
+        if self.game_state != GameStates.PLAYERS_TURN:
+            return False
+
+        with instrumentation.profiler.phase('player_turn'):
+            move = action.get('move')
+            pickup = action.get('pickup')
+            take_stairs = action.get('take_stairs')
+
+            player_turn_results = []
+
+            if move:
+                dx, dy = move
+                destination_x = self.player.x + dx
+                destination_y = self.player.y + dy
+
+                if self.game_map.walkable[destination_x, destination_y]:
+                    target = get_blocking_entities_at_location(self.entities, destination_x, destination_y)
+
+                    if target:
+                        self.activation.make_noise(destination_x, destination_y)
+                        attack_results = self.player.fighter.attack(target)
+                        player_turn_results.extend(attack_results)
+                    else:
+                        self.player.move(dx, dy)
+
+                        self.fov_recompute = True
+
+                        if self.game_map.follow(self.player, self.entities):
+                            self.map_moved = True
+                            # the old field of view and distances refer to the previous window position
+                            self.distance_map.target = None
+                            self.update_fov()
+
+                    self.game_state = GameStates.ENEMY_TURN
+
+            if pickup:
+                # pick up an item: look for one in the player's tile
+                for entity in self.entities.get_entities_at(self.player.x, self.player.y):
+                    if entity.item:
+                        pickup_results = entity.item.pick_up(self.entities, self.inventory, self.colors,
+                                                             self.inventory_capacity)
+                        player_turn_results.extend(pickup_results)
+                        break
+                self.game_state = GameStates.ENEMY_TURN
+
+            if take_stairs:
+                # a new level is a fresh start, its monsters don't get a turn
+                return self.take_stairs()
+
+            self.process_results(player_turn_results)
+
+        if self.game_state != GameStates.ENEMY_TURN:
+            return False
+
+        with instrumentation.profiler.phase('enemy_turn'):
+            self.play_enemy_turn()
+        self.turn += 1
+
+        self.activation.update(self.turn, self.game_map.fov)
+        self.decay_corpses()
+
+        # one write per turn however many messages the turn produced
+        self.message_log.flush()
+
+        return True
+
+    def take_stairs(self):
+        """
+        Takes the stairs the player stands on, if the floor they lead to is ready. The floor the player leaves is
+        kept in self.levels; a floor the player comes back to first catches up on the turns it missed.
+
+        :return: bool (True if the player changed floors)
+        """
+        for entity in self.entities.get_entities_at(self.player.x, self.player.y):
+            if entity.stairs:
+                floor = entity.stairs.floor
+                level = None
+
+                if self.levels is not None:
+                    level = self.levels.take(floor, self.turn,
+                                             self.rng.derive('catch_up:{0}:{1}'.format(floor, self.turn)))
+
+                if level is not None:
+                    game_map, entities, corpses, start = level.game_map, level.entities, level.corpses, None
+                else:
+                    generated = self.level_source(floor) if self.level_source else None
+
+                    if generated is None:
+                        self.message_log.add_message(Message('The stairs are still blocked.',
+                                                             self.colors.get('orange')))
+                        return False
+
+                    game_map, entities, start = generated
+                    corpses = ()
+
+                self.entities.remove(self.player)
+
+                if self.levels is not None:
+                    self.levels.store(self.floor, self.game_map, self.entities, self.corpses, self.turn,
+                                      keep=(floor - 1, floor + 1))
+
+                # arrive on the stairs leading back, if there are any
+                for other in entities:
+                    if other.stairs and other.stairs.floor == self.floor:
+                        start = (other.x, other.y)
+                        break
+
+                self.player.x, self.player.y = start
+                entities.append(self.player)
+
+                self.set_level(game_map, entities)
+                self.corpses.extend(corpses)
+                direction = 'descend' if floor > self.floor else 'climb'
+                self.floor = floor
+                self.map_moved = True
+                self.turn += 1
+
+                self.message_log.add_message(Message('You {0} to floor {1}.', self.colors.get('violet'),
+                                                     args=(direction, self.floor)))
+                self.message_log.flush()
+
+                return True
+
+        self.message_log.add_message(Message('There are no stairs here.', self.colors.get('orange')))
+
+        return False
+
+    def play_enemy_turn(self):
+        """
+        Lets every awake monster act whose next action is due during the player's action, then hands the turn back to
+        the player unless they died. Monsters act once per player action at equal speed; faster monsters act more
+        often, slower ones skip turns.
+        """
+        # one distance map towards the player serves every monster this turn
+        self.distance_map.update(self.player.x, self.player.y)
+
+        self.scheduler.advance(action_delay(self.player))
+
+        profiler = instrumentation.profiler
+
+        for entity in self.scheduler.due():
+            with profiler.phase('take_turn'):
+                enemy_turn_results = entity.ai.take_turn(self.player, self.game_map, self.entities,
+                                                         self.distance_map)
+            profiler.count('monsters_acted')
+            self.scheduler.schedule(entity, action_delay(entity))
+
+            self.process_results(enemy_turn_results)
+
+            if self.game_state == GameStates.PLAYER_DEAD:
+                break
+        else:
+            self.game_state = GameStates.PLAYERS_TURN
+
+    def decay_corpses(self):
+        """
+        Removes corpses older than corpse_lifetime and returns them to the entity pool.
+        Corpses stored away in an unloaded chunk are forgotten and stay where they are.
+        """
+        if self.corpse_lifetime is None:
+            self.corpses.clear()
+            return
+
+        while self.corpses and self.turn - self.corpses[0][0] >= self.corpse_lifetime:
+            turn, corpse = self.corpses.popleft()
+
+            if corpse.index is self.entities:
+                self.entity_pool.release(corpse)
+
+    def process_results(self, results):
+        """
+        Applies results of attacks and other actions: logs messages and kills dead entities.
+
+        :param results: list<dict>
+        """
+        for result in results:
+            message = result.get('message')
+            dead_entity = result.get('dead')
+
+            if message:
+                self.message_log.add_message(message)
+
+            if dead_entity:
+                if dead_entity == self.player:
+                    message, self.game_state = kill_player(dead_entity, self.colors)
+                else:
+                    self.activation.sleep(dead_entity)
+                    message = kill_monster(dead_entity, self.colors)
+
+                    if self.corpse_lifetime is not None:
+                        self.corpses.append((self.turn, dead_entity))
+
+                self.message_log.add_message(message)
+
+                if self.game_state == GameStates.PLAYER_DEAD:
+                    break
+
+
+def new_game(map_width, map_height, max_rooms, room_min_size, room_max_size, max_monsters_per_room, max_room_items,
+             message_log, colors, fov_algorithm='BASIC', fov_radius=10, fov_light_walls=True, seed=None):
+    """
+    Creates the player and a freshly generated level.
+
+    :param map_width: int
+    :param map_height: int
+    :param max_rooms: int
+    :param room_min_size: int
+    :param room_max_size: int
+    :param max_monsters_per_room: int
+    :param max_room_items: int
+    :param message_log: MessageLog
+    :param colors: Palette
+    :param fov_algorithm: string
+    :param fov_radius: int
+    :param fov_light_walls: bool
+    :param seed: int/None (random seed if None)
+    :return: GameSession
+    """
+    rng = RandomStreams(seed)
+    # the first floor has its own seed like the others, so LevelPregenerator can build it again when it was lost,
+    # e.g. after loading a save
+    floor_rng = RandomStreams(level_seed(rng.seed, 1))
+
+    fighter_component = Fighter(hp=30, defense=2, power=5)
+    player = Entity(0, 0, '@', colors.id('white'), 'Player', render_order=RenderOrder.ACTOR,
+                    blocks=True, fighter=fighter_component, light=Light(fov_radius, colors.get('white')))
+    entities = EntityIndex([player])
+
+    game_map = GameMap(map_width, map_height)
+    make_map(game_map, max_rooms, room_min_size, room_max_size, map_width, map_height, player, entities,
+             max_monsters_per_room, colors, max_room_items, floor_rng.map, floor_rng.spawn)
+
+    return GameSession(player, entities, game_map, message_log, colors, fov_algorithm, fov_radius, fov_light_walls,
+                       rng=rng)
+
+
+def new_chunked_game(map_width, map_height, chunk_size, max_loaded_chunks, message_log, colors, fov_algorithm='BASIC',
+                     fov_radius=10, fov_light_walls=True, spill_directory=None, seed=None):
+    """
+    Creates the player in an unbounded world generated chunk by chunk around them.
+
+    :param map_width: int (width of the loaded window)
+    :param map_height: int (height of the loaded window)
+    :param chunk_size: int
+    :param max_loaded_chunks: int
+    :param message_log: MessageLog
+    :param colors: Palette
+    :param fov_algorithm: string
+    :param fov_radius: int
+    :param fov_light_walls: bool
+    :param spill_directory: string/None
+    :param seed: int/None (random seed if None)
+    :return: GameSession
+    """
+    rng = RandomStreams(seed)
+
+    fighter_component = Fighter(hp=30, defense=2, power=5)
+    player = Entity(0, 0, '@', colors.id('white'), 'Player', render_order=RenderOrder.ACTOR,
+                    blocks=True, fighter=fighter_component, light=Light(fov_radius, colors.get('white')))
+    entities = EntityIndex([player])
+
+    world = ChunkedWorld(chunk_size, colors, max_loaded_chunks, spill_directory, rng=rng)
+    game_map = ChunkedGameMap(world, map_width, map_height, margin=fov_radius)
+
+    # nothing is loaded yet, so window and world coordinates are the same
+    player.set_position(*world.get_chunk(0, 0).start)
+    game_map.follow(player, entities)
+
+    session = GameSession(player, entities, game_map, message_log, colors, fov_algorithm, fov_radius,
+                          fov_light_walls, rng=rng)
+    # chunks generated from now on recycle the corpses that decayed
+    world.entity_pool = session.entity_pool
+
+    return session
@@ -1,3 +1,8 @@
+import time
+
+import tdl
+
+
 def handle_keys(user_input):
     """
     Keyboard input handler.
@@ -27,6 +32,8 @@ def handle_keys(user_input):
         return {'pickup': True}
     elif key_char == 'i':
         return {'inventory': True}
+    elif key_char == '>' or key_char == '<':
+        return {'take_stairs': True}
 
     if user_input.key == 'ENTER' and user_input.alt:
         # Alt+Enter: toggle full screen
@@ -37,3 +44,33 @@ def handle_keys(user_input):
 
     # No key was pressed
     return {}
+
+
+def wait_for_events(events, timeout, poll_interval, backend=tdl):
+    """
+    Adds pending input events to events, sleeping until some arrive or timeout passes, so an idle game doesn't spin.
+    Returns at once if events still holds some. Unlike tdl.event.wait it collects every pending event and doesn't
+    flush the console. Callers take events from the left one at a time and leave the rest for later.
+
+    :param events: collections.deque<tdl.event.Event> (events not handled yet)
+    :param timeout: float (seconds)
+    :param poll_interval: float (seconds between checks)
+    :param backend: module (tdl or terminal_backend)
+    :return: collections.deque<tdl.event.Event> (events)
+    """
+    deadline = time.perf_counter() + timeout
+
+    while not events:
+        events.extend(backend.event.get())
+
+        if events or backend.event.is_window_closed():
+            break
+
+        remaining = deadline - time.perf_counter()
+
+        if remaining <= 0:
+            break
+
+        time.sleep(min(poll_interval, remaining))
+
+    return events
@@ -0,0 +1,239 @@
+"""
+Opt-in profiling of the main loop.
+
+Code under measurement reads the module attribute at call time:
+
+    with instrumentation.profiler.phase('fov'):
+        ...
+    instrumentation.profiler.count('cells_drawn', n)
+
+By default profiler is a NullProfiler whose methods do nothing, so instrumented code only pays for a method call.
+enable() swaps in a Profiler that keeps rolling per-frame statistics and, optionally, a trace that Chrome's
+about:tracing, Perfetto and speedscope can open.
+"""
+from collections import deque
+import json
+import os
+import time
+
+import numpy as np
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullProfiler:
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, amount=1):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, history=240, trace=False):
+        """
+        Collects the time spent in each phase and counter totals, per frame. The last history frames are kept
+        for statistics and histograms.
+
+        :param history: int (frames)
+        :param trace: bool (also record every phase call for write_trace)
+        """
+        self.history = history
+        # name -> deque<float> (seconds per frame in which the phase ran)
+        self.timings = {}
+        # name -> deque<int> (total per frame)
+        self.counters = {}
+
+        self.frame_timings = {}
+        self.frame_counters = {}
+        self.frame_start = time.perf_counter()
+        self.frames = 0
+
+        self.origin = self.frame_start
+        self.trace_events = [] if trace else None
+
+    def phase(self, name):
+        """
+        Returns a context manager that times its block as phase name.
+
+        :param name: string
+        :return: context manager
+        """
+        return _Phase(self, name)
+
+    def record(self, name, start, end):
+        """
+        Adds a timed call of a phase to the current frame.
+
+        :param name: string
+        :param start: float (time.perf_counter)
+        :param end: float (time.perf_counter)
+        """
+        self.frame_timings[name] = self.frame_timings.get(name, 0.0) + end - start
+
+        if self.trace_events is not None:
+            self.trace_events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                                      'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6})
+
+    def count(self, name, amount=1):
+        """
+        Adds to a counter of the current frame.
+
+        :param name: string
+        :param amount: int
+        """
+        self.frame_counters[name] = self.frame_counters.get(name, 0) + amount
+
+    def end_frame(self):
+        """
+        Closes the current frame: its totals go into the rolling history.
+        """
+        now = time.perf_counter()
+        self.frame_timings['frame'] = now - self.frame_start
+
+        for name, total in self.frame_timings.items():
+            if name not in self.timings:
+                self.timings[name] = deque(maxlen=self.history)
+            self.timings[name].append(total)
+
+        for name, total in self.frame_counters.items():
+            if name not in self.counters:
+                self.counters[name] = deque(maxlen=self.history)
+            self.counters[name].append(total)
+
+        if self.trace_events is not None and self.frame_counters:
+            self.trace_events.append({'name': 'counters', 'ph': 'C', 'pid': os.getpid(), 'tid': 0,
+                                      'ts': (now - self.origin) * 1e6, 'args': dict(self.frame_counters)})
+
+        self.frame_timings = {}
+        self.frame_counters = {}
+        self.frame_start = now
+        self.frames += 1
+
+    def get_histogram(self, name, bins=10):
+        """
+        Returns a histogram of the per-frame time of a phase over the rolling history.
+
+        :param name: string
+        :param bins: int
+        :return: tuple(numpy.ndarray<int> (counts), numpy.ndarray<float> (bin edges in seconds))
+        """
+        return np.histogram(np.fromiter(self.timings.get(name, ()), dtype=float), bins=bins)
+
+    def get_summary(self):
+        """
+        Returns statistics of every phase over the rolling history, slowest mean first.
+
+        :return: list<tuple(string (name), float (mean ms), float (95th percentile ms), float (max ms))>
+        """
+        summary = []
+
+        for name, timings in self.timings.items():
+            milliseconds = np.fromiter(timings, dtype=float) * 1000
+            summary.append((name, float(milliseconds.mean()), float(np.percentile(milliseconds, 95)),
+                            float(milliseconds.max())))
+
+        summary.sort(key=lambda row: row[1], reverse=True)
+
+        return summary
+
+    def get_counter_means(self):
+        """
+        Returns the mean per-frame value of every counter over the rolling history.
+
+        :return: dict<string, float>
+        """
+        return {name: sum(totals) / len(totals) for name, totals in self.counters.items()}
+
+    def write_trace(self, path):
+        """
+        Writes the recorded phase calls in Chrome trace event format.
+
+        :param path: string
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events or [], 'displayTimeUnit': 'ms'}, f)
+
+
+profiler = NullProfiler()
+
+
+def enable(history=240, trace=False):
+    """
+    Starts profiling.
+
+    :param history: int (frames)
+    :param trace: bool
+    :return: Profiler
+    """
+    global profiler
+    profiler = Profiler(history, trace)
+
+    return profiler
+
+
+def disable():
+    """
+    Stops profiling.
+    """
+    global profiler
+    profiler = NullProfiler()
+
+
+def render_overlay(con, active_profiler, x, y, width, colors):
+    """
+    Draws the slowest phases and the counters as a text table.
+
+    :param con: tdl.Console
+    :param active_profiler: Profiler
+    :param x: int
+    :param y: int
+    :param width: int
+    :param colors: dict<tuple<int>(r, g, b)>
+    :return: int (number of lines drawn)
+    """
+    lines = ['{0:<16}{1:>7}{2:>7}{3:>7}'.format('phase ms', 'mean', 'p95', 'max')]
+    lines.extend('{0:<16}{1:>7.2f}{2:>7.2f}{3:>7.2f}'.format(name[:16], mean, p95, maximum)
+                 for name, mean, p95, maximum in active_profiler.get_summary())
+    lines.extend('{0:<16}{1:>21.1f}'.format(name[:16], mean)
+                 for name, mean in sorted(active_profiler.get_counter_means().items()))
+
+    for i, line in enumerate(lines):
+        # pad so shorter lines cover what the previous frame drew
+        con.draw_str(x, y + i, line[:width].ljust(width), fg=colors.get('white'), bg=colors.get('black'))
+
+    return len(lines)
@@ -0,0 +1,163 @@
+"""
+Generation of the floors below the current one in a worker process.
+
+Levels are generated from a seed derived from the session seed and the floor number, so a floor is the same
+whether it was generated ahead of time, on demand or during a replay. The worker hands levels back as compact
+plain data: bit-packed map layers and entity dicts.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_loaders import entity_from_dict, entity_to_dict
+from entity import Entity
+from entity_index import EntityIndex
+from map_utils import GameMap, make_map
+from rng import RandomStreams, level_seed
+
+
+LAYERS = ['walkable', 'transparent', 'explored']
+
+
+def generate_level_data(settings, colors, seed, floor):
+    """
+    Generates a level and returns it as plain data. Runs in the worker process.
+
+    :param settings: dict (map_width, map_height, max_rooms, room_min_size, room_max_size, max_monsters_per_room and
+                     max_room_items)
+    :param colors: Palette
+    :param seed: int/string
+    :param floor: int
+    :return: dict
+    """
+    rng = RandomStreams(seed)
+    width = settings['map_width']
+    height = settings['map_height']
+
+    # make_map puts the player in the first room; only that position is kept
+    start = Entity(0, 0, '@', None, 'Start')
+    entities = EntityIndex()
+
+    game_map = GameMap(width, height)
+    make_map(game_map, settings['max_rooms'], settings['room_min_size'], settings['room_max_size'], width, height,
+             start, entities, settings['max_monsters_per_room'], colors, settings['max_room_items'], rng.map,
+             rng.spawn, floor)
+
+    return level_to_data(game_map, entities, (start.x, start.y), floor)
+
+
+def level_to_data(game_map, entities, start, floor):
+    """
+    Converts a level to plain data: bit-packed map layers and entity dicts.
+
+    :param game_map: GameMap
+    :param entities: iterable<Entity> (without the player)
+    :param start: tuple<int>(x, y) (where the player arrives)
+    :param floor: int
+    :return: dict
+    """
+    data = {
+        'floor': floor,
+        'width': game_map.width,
+        'height': game_map.height,
+        'start': tuple(start),
+        'entities': [entity_to_dict(entity) for entity in entities],
+    }
+
+    for name in LAYERS:
+        data[name] = np.packbits(getattr(game_map, name).ravel(order='F')).tobytes()
+
+    return data
+
+
+def build_level(data, entity_pool=None):
+    """
+    Turns level data back into a map and its entities.
+
+    :param data: dict (as returned by generate_level_data or level_to_data)
+    :param entity_pool: EntityPool/None (entities are recycled from it if given)
+    :return: tuple(GameMap, EntityIndex, tuple<int>(x, y) (where the player arrives))
+    """
+    width = data['width']
+    height = data['height']
+
+    game_map = GameMap(width, height)
+
+    for name in LAYERS:
+        bits = np.unpackbits(np.frombuffer(data[name], dtype=np.uint8), count=width * height)
+        getattr(game_map, name)[...] = bits.reshape((width, height), order='F').view(bool)
+
+    game_map.revision += 1
+
+    entities = EntityIndex(entity_from_dict(entity_data, entity_pool) for entity_data in data['entities'])
+
+    return game_map, entities, tuple(data['start'])
+
+
+class LevelPregenerator:
+    def __init__(self, settings, colors, session_seed, lookahead=1, workers=1, background=True, entity_pool=None):
+        """
+        Keeps the next floors generating in a worker process, so descending never waits for make_map.
+        Use get_level as GameSession.level_source.
+
+        :param settings: dict (see generate_level_data)
+        :param colors: Palette
+        :param session_seed: int/string
+        :param lookahead: int (floors generated ahead of the one the player is on)
+        :param workers: int (worker processes)
+        :param background: bool (False generates levels in the calling process when they are asked for, as
+                           replays do)
+        :param entity_pool: EntityPool/None (entities of the levels are recycled from it if given)
+        """
+        self.settings = settings
+        self.colors = colors
+        self.session_seed = session_seed
+        self.lookahead = lookahead
+        self.entity_pool = entity_pool
+        self.executor = ProcessPoolExecutor(max_workers=workers) if background else None
+        # floor -> Future
+        self.pending = {}
+
+    def request(self, floor):
+        """
+        Starts generating floor and the floors after it, up to the lookahead, unless they already are.
+
+        :param floor: int
+        """
+        if self.executor is None:
+            return
+
+        for ahead in range(floor, floor + self.lookahead):
+            if ahead not in self.pending:
+                self.pending[ahead] = self.executor.submit(generate_level_data, self.settings, self.colors,
+                                                           level_seed(self.session_seed, ahead), ahead)
+
+    def get_level(self, floor):
+        """
+        Returns a generated floor without waiting, and starts generating the floors after it.
+
+        :param floor: int
+        :return: tuple(GameMap, EntityIndex, tuple<int>(x, y))/None (None while the floor is still generating)
+        """
+        if self.executor is None:
+            return build_level(generate_level_data(self.settings, self.colors,
+                                                   level_seed(self.session_seed, floor), floor), self.entity_pool)
+
+        self.request(floor)
+        future = self.pending[floor]
+
+        if not future.done():
+            return None
+
+        del self.pending[floor]
+        self.request(floor + 1)
+
+        return build_level(future.result(), self.entity_pool)
+
+    def shutdown(self):
+        """
+        Stops the worker process without waiting for levels still being generated.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
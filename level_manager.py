@@ -0,0 +1,195 @@
+"""
+Floors the player has left.
+
+Left floors are kept in memory while they fit in a memory budget; beyond it the least recently used ones, except
+the floors next to the current one, are written to disk as compressed snapshots and read back when the player
+returns. Nothing on a left floor is ticked. When the player comes back, catch_up moves its monsters around for the
+turns that passed instead.
+"""
+from collections import OrderedDict
+import os
+import pickle
+import tempfile
+import zlib
+
+from entity import get_blocking_entities_at_location
+from level_generation import build_level, level_to_data
+from turn_scheduler import NORMAL_SPEED
+
+
+# rough memory use of a map cell (walkable, transparent, fov and explored, plus libtcod's own map) and of an entity
+# with its components (see the monster_memory benchmark)
+CELL_BYTES = 8
+ENTITY_BYTES = 800
+
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+class Level:
+    def __init__(self, floor, game_map, entities, corpses=(), turn=0):
+        """
+        A floor that is not being played.
+
+        :param floor: int
+        :param game_map: GameMap
+        :param entities: EntityIndex (without the player)
+        :param corpses: iterable<tuple(int (turn of death), Entity)>
+        :param turn: int (turn the player left)
+        """
+        self.floor = floor
+        self.game_map = game_map
+        self.entities = entities
+        self.corpses = list(corpses)
+        self.turn = turn
+
+    def estimate_size(self):
+        """
+        :return: int (bytes)
+        """
+        return self.game_map.width * self.game_map.height * CELL_BYTES + len(self.entities) * ENTITY_BYTES
+
+
+class LevelManager:
+    def __init__(self, memory_budget=32 * 2 ** 20, spill_directory=None, entity_pool=None):
+        """
+        :param memory_budget: int (bytes of left floors kept in memory)
+        :param spill_directory: string/None (temporary directory, created when first needed, if None)
+        :param entity_pool: EntityPool/None (entities of spilled floors go back to it and loaded ones come from it)
+        """
+        self.memory_budget = memory_budget
+        self.spill_directory = spill_directory
+        self.entity_pool = entity_pool
+        # floor -> Level, least recently used first
+        self.levels = OrderedDict()
+        self.spilled = set()
+
+    def __contains__(self, floor):
+        return floor in self.levels or floor in self.spilled
+
+    def memory_used(self):
+        """
+        :return: int (estimated bytes of the floors in memory)
+        """
+        return sum(level.estimate_size() for level in self.levels.values())
+
+    def store(self, floor, game_map, entities, corpses, turn, keep=()):
+        """
+        Keeps a floor the player leaves, then spills floors to disk until the rest fit in the memory budget.
+
+        :param floor: int
+        :param game_map: GameMap
+        :param entities: EntityIndex (without the player)
+        :param corpses: iterable<tuple(int (turn of death), Entity)>
+        :param turn: int
+        :param keep: iterable<int> (floors that stay in memory, e.g. the ones next to the player)
+        """
+        self.levels[floor] = Level(floor, game_map, entities, corpses, turn)
+        self.levels.move_to_end(floor)
+        self.spilled.discard(floor)
+
+        self.evict(set(keep))
+
+    def take(self, floor, turn, rng):
+        """
+        Hands a stored floor back, from memory or disk, caught up to turn. The floor is no longer stored afterwards.
+
+        :param floor: int
+        :param turn: int
+        :param rng: random.Random (for catch_up)
+        :return: Level/None (None if the floor was never stored)
+        """
+        if floor in self.levels:
+            level = self.levels.pop(floor)
+        elif floor in self.spilled:
+            self.spilled.remove(floor)
+            level = self._load(floor)
+        else:
+            return None
+
+        catch_up(level, turn, rng)
+
+        return level
+
+    def evict(self, keep):
+        """
+        Spills least recently used floors to disk until the floors in memory fit in the memory budget.
+
+        :param keep: set<int> (floors that must stay in memory)
+        """
+        used = self.memory_used()
+
+        for floor in list(self.levels):
+            if used <= self.memory_budget:
+                break
+
+            if floor not in keep:
+                level = self.levels.pop(floor)
+                used -= level.estimate_size()
+                self._spill(level)
+
+    def _path(self, floor):
+        if self.spill_directory is None:
+            self.spill_directory = tempfile.mkdtemp(prefix='roguelike_levels_')
+
+        return os.path.join(self.spill_directory, 'floor_{0}.level'.format(floor))
+
+    def _spill(self, level):
+        entities = list(level.entities)
+        positions = {entity: i for i, entity in enumerate(entities)}
+
+        data = level_to_data(level.game_map, entities, (0, 0), level.floor)
+        data['turn'] = level.turn
+        data['corpses'] = [(turn, positions[corpse]) for turn, corpse in level.corpses if corpse in positions]
+
+        with open(self._path(level.floor), 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL), 1))
+
+        self.spilled.add(level.floor)
+
+        if self.entity_pool is not None:
+            # the snapshot holds everything about them now
+            for entity in entities:
+                self.entity_pool.release(entity)
+
+    def _load(self, floor):
+        path = self._path(floor)
+
+        with open(path, 'rb') as f:
+            data = pickle.loads(zlib.decompress(f.read()))
+
+        os.remove(path)
+
+        game_map, entities, start = build_level(data, self.entity_pool)
+        entity_list = list(entities)
+        corpses = [(turn, entity_list[position]) for turn, position in data['corpses']]
+
+        return Level(floor, game_map, entities, corpses, data['turn'])
+
+
+def catch_up(level, turn, rng, max_steps=20):
+    """
+    Advances the monsters of a floor the player left at level.turn to turn. Rather than playing the missed turns,
+    each monster wanders a few random steps, more the longer the player was away, up to max_steps.
+
+    :param level: Level
+    :param turn: int
+    :param rng: random.Random
+    :param max_steps: int
+    """
+    elapsed = turn - level.turn
+    game_map = level.game_map
+
+    for entity in list(level.entities):
+        if not entity.ai:
+            continue
+
+        for step in range(min(elapsed * entity.speed // NORMAL_SPEED, max_steps)):
+            dx, dy = rng.choice(DIRECTIONS)
+            x = entity.x + dx
+            y = entity.y + dy
+
+            if (0 <= x < game_map.width and 0 <= y < game_map.height and game_map.walkable[x, y]
+                    and not get_blocking_entities_at_location(level.entities, x, y)):
+                entity.set_position(x, y)
+
+    level.turn = turn
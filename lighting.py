@@ -0,0 +1,103 @@
+"""
+Light map: the light every cell receives from the light sources on the level.
+
+Each light adds its color, fading linearly to nothing at its radius, to the cells it can see. Static lights are
+summed once into a cached buffer that is only rebuilt when a static light comes or goes or the map changes, so
+their number doesn't matter per frame. Moving lights are added on top whenever one of them moved, using field of
+view results from the FovCache.
+"""
+import numpy as np
+
+
+class LightMap:
+    def __init__(self, game_map, fov_cache, fov='BASIC', light_walls=True, ambient=0.35):
+        """
+        :param game_map: GameMap
+        :param fov_cache: FovCache
+        :param fov: string (algorithm used for light)
+        :param light_walls: bool
+        :param ambient: float (light every visible cell gets, so unlit cells in view stand out from remembered ones)
+        """
+        self.game_map = game_map
+        self.fov_cache = fov_cache
+        self.fov = fov
+        self.light_walls = light_walls
+        self.ambient = ambient
+
+        # Light -> None, in the order they were added
+        self.static_lights = {}
+        self.moving_lights = {}
+
+        # RGB light per cell, 1.0 being full light
+        self.light = np.zeros((game_map.width, game_map.height, 3), dtype=np.float32)
+        # bumped whenever light changes so renderers know when to redraw tiles
+        self.revision = 0
+
+        self._static = np.zeros_like(self.light)
+        # map revision the cached buffer was built from, None to rebuild
+        self._static_key = None
+        # map revision and moving light positions self.light was built from
+        self._moving_key = None
+
+    def add(self, light):
+        """
+        :param light: Light
+        """
+        if light.static:
+            self.static_lights[light] = None
+            self._static_key = None
+        else:
+            self.moving_lights[light] = None
+
+    def remove(self, light):
+        """
+        :param light: Light
+        """
+        if light in self.static_lights:
+            del self.static_lights[light]
+            self._static_key = None
+        else:
+            self.moving_lights.pop(light, None)
+
+    def update(self):
+        """
+        Recomputes the light map if a light moved, a static light was added or removed, or the map changed.
+
+        :return: bool (True if the light changed)
+        """
+        static_key = self.game_map.revision
+        moving_key = (static_key, tuple((light.owner.x, light.owner.y) for light in self.moving_lights))
+
+        if static_key == self._static_key and moving_key == self._moving_key:
+            return False
+
+        if static_key != self._static_key:
+            self._static[...] = 0
+
+            for light in self.static_lights:
+                self._add_light(self._static, light)
+
+            self._static_key = static_key
+
+        self.light[...] = self._static
+
+        for light in self.moving_lights:
+            self._add_light(self.light, light)
+
+        self._moving_key = moving_key
+        self.revision += 1
+
+        return True
+
+    def _add_light(self, buffer, light):
+        x = light.owner.x
+        y = light.owner.y
+
+        window, visible = self.fov_cache.get_visible(self.game_map, x, y, self.fov, light.radius, self.light_walls)
+
+        dx = np.arange(window[0].start, window[0].stop) - x
+        dy = np.arange(window[1].start, window[1].stop) - y
+        distance = np.sqrt(dx[:, np.newaxis] ** 2 + dy[np.newaxis, :] ** 2)
+
+        falloff = np.maximum(1 - distance / (light.radius + 1), 0) * light.intensity * visible
+        buffer[window] += falloff[..., np.newaxis] * (np.asarray(light.color, dtype=np.float32) / 255)
@@ -1,10 +1,13 @@
-from tdl.map import Map
+import random
 
-from random import randint
+import numpy as np
+from tdl.map import Map
 
 from components.ai import BasicMonster
 from components.fighter import Fighter
 from components.item import Item
+from components.light import Light
+from components.stairs import Stairs
 
 from render_functions import RenderOrder
 from entity import Entity
@@ -19,7 +22,20 @@ class GameMap(Map):
         :param height: int
         """
         super().__init__(width, height)
-        self.explored = [[False for y in range(height)] for x in range(width)]
+        # same (width, height) Fortran-ordered layout as the walkable, transparent and fov arrays
+        self.explored = np.zeros((width, height), dtype=bool, order='F')
+        # bumped whenever transparent changes, so cached fields of view can tell they are stale
+        self.revision = 0
+
+    def follow(self, entity, entities):
+        """
+        Keeps the loaded part of the world around entity. A fixed size map never moves.
+
+        :param entity: Entity
+        :param entities: EntityIndex
+        :return: bool (True if the map moved under the entities)
+        """
+        return False
 
 
 class Rect:
@@ -58,51 +74,115 @@ class Rect:
                 self.y1 <= other.y2 and self.y2 >= other.y1)
 
 
-def place_entities(room, entities, max_monsters_per_room, colors):
+class RoomIndex:
+    def __init__(self, width, height):
+        """
+        Cells covered by accepted rooms, walls included, so overlap checks don't have to look at every room.
+
+        :param width: int
+        :param height: int
+        """
+        self.cells = np.zeros((width, height), dtype=bool)
+
+    def intersects(self, room):
+        """
+        Returns true if room intersects with any room added so far, the same as Rect.intersect against each.
+
+        :param room: Rect
+        :return: bool
+        """
+        return self.cells[room.x1:room.x2 + 1, room.y1:room.y2 + 1].any()
+
+    def add(self, room):
+        """
+        Adds an accepted room.
+
+        :param room: Rect
+        """
+        self.cells[room.x1:room.x2 + 1, room.y1:room.y2 + 1] = True
+
+
+def place_entities(room, entities, max_monsters_per_room, colors, rng=random, entity_pool=None):
     """
     Randomly places entities.
 
     :param room: Rect
-    :param entities: list<Entity>
+    :param entities: EntityIndex
     :param max_monsters_per_room: int
-    :param colors: dict<tuple<int>(r, g, b)>>
+    :param colors: Palette
+    :param rng: random.Random (the global generator by default)
+    :param entity_pool: EntityPool/None (monsters are recycled from it if given)
     """
+    spawn = entity_pool.acquire if entity_pool is not None else Entity
+
     # Get a random number of monsters
-    number_of_monsters = randint(0, max_monsters_per_room)
+    number_of_monsters = rng.randint(0, max_monsters_per_room)
 
     for i in range(number_of_monsters):
         # Choose a random location in the room
-        x = randint(room.x1 + 1, room.x2 - 1)
-        y = randint(room.y1 + 1, room.y2 - 1)
+        x = rng.randint(room.x1 + 1, room.x2 - 1)
+        y = rng.randint(room.y1 + 1, room.y2 - 1)
 
-        if not any([entity for entity in entities if entity.x == x and entity.y == y]):
-            if randint(0, 100) < 80:
+        if not entities.get_entities_at(x, y):
+            if rng.randint(0, 100) < 80:
                 fighter_component = Fighter(hp=10, defense=0, power=3)
                 ai_component = BasicMonster()
 
-                monster = Entity(x, y, 'o', colors.get('desaturated_green'), 'Orc', blocks=True,
-                                 render_order=RenderOrder.ACTOR, fighter=fighter_component, ai=ai_component)
+                monster = spawn(x, y, 'o', colors.id('desaturated_green'), 'Orc', blocks=True,
+                                render_order=RenderOrder.ACTOR, fighter=fighter_component, ai=ai_component)
             else:
                 fighter_component = Fighter(hp=16, defense=1, power=4)
                 ai_component = BasicMonster()
 
-                monster = Entity(x, y, 'T', colors.get('darker_green'), 'Troll', blocks=True,
-                                 render_order=RenderOrder.ACTOR, fighter=fighter_component, ai=ai_component)
+                # trolls glow faintly
+                monster = spawn(x, y, 'T', colors.id('darker_green'), 'Troll', blocks=True,
+                                render_order=RenderOrder.ACTOR, fighter=fighter_component, ai=ai_component,
+                                light=Light(2, colors.get('darker_green'), 0.6))
 
             entities.append(monster)
 
 
+def place_items(room, entities, max_room_items, colors, rng=random, entity_pool=None):
+    """
+    Randomly places items.
+
+    :param room: Rect
+    :param entities: EntityIndex
+    :param max_room_items: int
+    :param colors: Palette
+    :param rng: random.Random (the global generator by default)
+    :param entity_pool: EntityPool/None (items are recycled from it if given)
+    """
+    spawn = entity_pool.acquire if entity_pool is not None else Entity
+
+    # choose random number of items
+    num_items = rng.randint(0, max_room_items)
+
+    for i in range(num_items):
+        # choose random spot for this item
+        x = rng.randint(room.x1 + 1, room.x2 - 1)
+        y = rng.randint(room.y1 + 1, room.y2 - 1)
+
+        # only place it if the tile is not blocked
+        if not entities.get_entities_at(x, y):
+            # create a healing potion
+            item_component = Item()
+            item = spawn(x, y, '!', colors.id('violet'), 'healing potion', render_order=RenderOrder.ITEM,
+                         item=item_component)
+
+            entities.append(item)
+
+
 def create_room(game_map, room):
     """
-    Go through the tiles in the rectangle and make them passable.
+    Make the tiles inside the rectangle passable.
 
     :param game_map: GameMap
     :param room: Rect
     """
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            game_map.walkable[x, y] = True
-            game_map.transparent[x, y] = True
+    game_map.walkable[room.x1 + 1:room.x2, room.y1 + 1:room.y2] = True
+    game_map.transparent[room.x1 + 1:room.x2, room.y1 + 1:room.y2] = True
+    game_map.revision += 1
 
 
 def create_h_tunnel(game_map, x1, x2, y):
@@ -114,9 +194,9 @@ def create_h_tunnel(game_map, x1, x2, y):
     :param x2: int
     :param y: int
     """
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        game_map.walkable[x, y] = True
-        game_map.transparent[x, y] = True
+    game_map.walkable[min(x1, x2):max(x1, x2) + 1, y] = True
+    game_map.transparent[min(x1, x2):max(x1, x2) + 1, y] = True
+    game_map.revision += 1
 
 
 def create_v_tunnel(game_map, y1, y2, x):
@@ -128,13 +208,13 @@ def create_v_tunnel(game_map, y1, y2, x):
     :param y2: int
     :param x: int
     """
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        game_map.walkable[x, y] = True
-        game_map.transparent[x, y] = True
+    game_map.walkable[x, min(y1, y2):max(y1, y2) + 1] = True
+    game_map.transparent[x, min(y1, y2):max(y1, y2) + 1] = True
+    game_map.revision += 1
 
 
 def make_map(game_map, max_rooms, room_min_size, room_max_size, map_width, map_height, player, entities,
-             max_monsters_per_room, colors, max_room_items):
+             max_monsters_per_room, colors, max_room_items, map_rng=random, spawn_rng=random, floor=1):
     """
     Makes map.
 
@@ -145,79 +225,80 @@ def make_map(game_map, max_rooms, room_min_size, room_max_size, map_width, map_h
     :param map_width: int
     :param map_height: int
     :param player: Entity
-    :param entities: list<Entity>
+    :param entities: EntityIndex
     :param max_monsters_per_room: int
-    :param colors: dict<tuple<int>(r, g, b)>
+    :param colors: Palette
     :param max_room_items: int
+    :param map_rng: random.Random (for the layout, the global generator by default)
+    :param spawn_rng: random.Random (for monsters and items, the global generator by default)
+    :param floor: int (the stairs in the last room lead to the floor below, on floors below the first stairs in the
+                  first room lead back up)
     """
     rooms = []
     num_rooms = 0
 
+    room_index = RoomIndex(map_width, map_height)
+
     for r in range(max_rooms):
         # random width and height
-        w = randint(room_min_size, room_max_size)
-        h = randint(room_min_size, room_max_size)
+        w = map_rng.randint(room_min_size, room_max_size)
+        h = map_rng.randint(room_min_size, room_max_size)
         # random position without going out of the boundaries of the map
-        x = randint(0, map_width - w - 1)
-        y = randint(0, map_height - h - 1)
+        x = map_rng.randint(0, map_width - w - 1)
+        y = map_rng.randint(0, map_height - h - 1)
 
         # "Rect" class makes rectangles easier to work with
         new_room = Rect(x, y, w, h)
 
-        # run through the other rooms and see if they intersect with this one
-        for other_room in rooms:
-            if new_room.intersect(other_room):
-                break
-        else:
-                # this means there are no intersections, so this room is valid
+        # see if any other room intersects with this one
+        if not room_index.intersects(new_room):
+            # this means there are no intersections, so this room is valid
 
-                # "paint" it to the map's tiles
-                create_room(game_map, new_room)
+            # "paint" it to the map's tiles
+            create_room(game_map, new_room)
 
-                # center coordinates of new room, will be useful later
-                (new_x, new_y) = new_room.center()
+            # center coordinates of new room, will be useful later
+            (new_x, new_y) = new_room.center()
 
-                # place monsters
-                place_entities(new_room, entities, max_monsters_per_room, colors)
+            # place monsters
+            place_entities(new_room, entities, max_monsters_per_room, colors, spawn_rng)
 
-                # choose random number of items
-                num_items = randint(0, max_room_items)
+            # place items
+            place_items(new_room, entities, max_room_items, colors, spawn_rng)
 
-                for i in range(num_items):
-                    # choose random spot for this item
-                    x = randint(new_room.x1 + 1, new_room.x2 - 1)
-                    y = randint(new_room.y1 + 1, new_room.y2 - 1)
-
-                    # only place it if the tile is not blocked
-                    if not any([entity for entity in entities if entity.x == x and entity.y == y]):
-                        # create a healing potion
-                        item_component = Item()
-                        item = Entity(x, y, '!', colors.get("violet"), 'healing potion', render_order=RenderOrder.ITEM,
-                                      item=item_component)
+            if num_rooms == 0:
+                # this is the first room, where the player starts at
+                player.set_position(new_x, new_y)
+            else:
+                # all rooms after the first:
+                # connect it to the previous room with a tunnel
 
-                        entities.append(item)
+                # center coordinates of previous room
+                (prev_x, prev_y) = rooms[num_rooms - 1].center()
 
-                if num_rooms == 0:
-                    # this is the first room, where the player starts at
-                    player.x = new_x
-                    player.y = new_y
+                # flip a coin (random number that is either 0 or 1)
+                if map_rng.randint(0, 1) == 1:
+                    # first move horizontally, then vertically
+                    create_h_tunnel(game_map, prev_x, new_x, prev_y)
+                    create_v_tunnel(game_map, prev_y, new_y, new_x)
                 else:
-                    # all rooms after the first:
-                    # connect it to the previous room with a tunnel
-
-                    # center coordinates of previous room
-                    (prev_x, prev_y) = rooms[num_rooms - 1].center()
-
-                    # flip a coin (random number that is either 0 or 1)
-                    if randint(0, 1) == 1:
-                        # first move horizontally, then vertically
-                        create_h_tunnel(game_map, prev_x, new_x, prev_y)
-                        create_v_tunnel(game_map, prev_y, new_y, new_x)
-                    else:
-                        # first move vertically, then horizontally
-                        create_v_tunnel(game_map, prev_y, new_y, prev_x)
-                        create_h_tunnel(game_map, prev_x, new_x, new_y)
-
-                # finally, append the new room to the list
-                rooms.append(new_room)
-                num_rooms += 1
+                    # first move vertically, then horizontally
+                    create_v_tunnel(game_map, prev_y, new_y, prev_x)
+                    create_h_tunnel(game_map, prev_x, new_x, new_y)
+
+            # finally, append the new room to the list
+            rooms.append(new_room)
+            room_index.add(new_room)
+            num_rooms += 1
+
+    if rooms:
+        # stairs down in the center of the last room
+        stairs_x, stairs_y = rooms[-1].center()
+        entities.append(Entity(stairs_x, stairs_y, '>', colors.id('white'), 'Stairs', render_order=RenderOrder.STAIRS,
+                               stairs=Stairs(floor + 1), light=Light(5, colors.get('violet'), static=True)))
+
+    if rooms and floor > 1:
+        # stairs up where the player arrives
+        up_x, up_y = rooms[0].center()
+        entities.append(Entity(up_x, up_y, '<', colors.id('white'), 'Stairs up', render_order=RenderOrder.STAIRS,
+                               stairs=Stairs(floor - 1)))
@@ -0,0 +1,235 @@
+from collections import deque
+import textwrap
+
+import tdl
+
+from input_handlers import wait_for_events
+
+
+class Menu:
+    def __init__(self, header, width, screen_width, screen_height, colors, page_size=26, backend=tdl):
+        """
+        Menu window (inventory, shop etc). The window console is kept between uses and only rows that changed are
+        redrawn, so opening a long menu costs one page of drawing and moving the highlight costs two rows.
+        Options are shown a page at a time and picked by letter, with the keyboard or with the mouse.
+
+        :param header: string
+        :param width: int
+        :param screen_width: int
+        :param screen_height: int
+        :param colors: dict<tuple<int>(r, g, b)>
+        :param page_size: int (options per page, at most 26 so every option on a page has a letter)
+        :param backend: module (tdl or terminal_backend)
+        """
+        self.backend = backend
+        self.width = width
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.colors = colors
+        self.options = []
+        # index of the first option on the current page
+        self.offset = 0
+        # index of the highlighted option or None
+        self.highlighted = None
+
+        self.header_wrapped = textwrap.wrap(header, width)
+        header_height = len(self.header_wrapped)
+        # a line below the options shows the page number
+        self.page_size = max(1, min(page_size, 26, screen_height - header_height - 1))
+        self.height = header_height + self.page_size + 1
+
+        self.window = backend.Console(width, self.height)
+        self.x = screen_width // 2 - width // 2
+        self.y = screen_height // 2 - self.height // 2
+        # top edge of the first option on the screen
+        self.options_y = self.y + header_height
+
+        # rows of the window that changed since it was last blitted
+        self.dirty_rows = set()
+
+    def set_options(self, options):
+        """
+        Replaces the options and goes back to the first page.
+
+        :param options: list<string>
+        """
+        self.options = options
+        self.offset = 0
+        self.highlighted = None
+        self.draw_page()
+
+    @property
+    def page_count(self):
+        return max(1, (len(self.options) + self.page_size - 1) // self.page_size)
+
+    def draw_page(self):
+        """
+        Draws the header, the options of the current page and the page number into the window.
+        """
+        white = self.colors.get('white')
+        self.window.draw_rect(0, 0, self.width, self.height, ' ', fg=white, bg=self.colors.get('black'))
+
+        for i, line in enumerate(self.header_wrapped):
+            self.window.draw_str(0, i, line[:self.width])
+
+        for row in range(self.page_size):
+            self.draw_row(row)
+
+        if self.page_count > 1:
+            footer = '< page {0}/{1} >'.format(self.offset // self.page_size + 1, self.page_count)
+            self.window.draw_str(0, self.height - 1, footer[:self.width], fg=white)
+
+        self.dirty_rows.update(range(self.height))
+
+    def draw_row(self, row):
+        """
+        Draws one option row of the current page.
+
+        :param row: int (row on the page)
+        """
+        index = self.offset + row
+        y = len(self.header_wrapped) + row
+
+        if index >= len(self.options):
+            self.window.draw_rect(0, y, self.width, 1, ' ', bg=self.colors.get('black'))
+        else:
+            if index == self.highlighted:
+                fg, bg = self.colors.get('black'), self.colors.get('white')
+            else:
+                fg, bg = self.colors.get('white'), self.colors.get('black')
+
+            text = '(' + chr(ord('a') + row) + ') ' + self.options[index]
+            self.window.draw_str(0, y, text[:self.width].ljust(self.width), fg=fg, bg=bg)
+
+        self.dirty_rows.add(y)
+
+    def highlight(self, index):
+        """
+        Moves the highlight, turning the page if needed.
+
+        :param index: int/None
+        """
+        if index is not None:
+            index = max(0, min(index, len(self.options) - 1))
+
+        if index == self.highlighted:
+            return
+
+        previous = self.highlighted
+        self.highlighted = index
+
+        if index is not None and not self.offset <= index < self.offset + self.page_size:
+            self.offset = index - index % self.page_size
+            self.draw_page()
+            return
+
+        for changed in (previous, index):
+            if changed is not None and self.offset <= changed < self.offset + self.page_size:
+                self.draw_row(changed - self.offset)
+
+    def turn_page(self, pages):
+        """
+        :param pages: int (negative turns back)
+        """
+        offset = self.offset + pages * self.page_size
+
+        if 0 <= offset < len(self.options) and offset != self.offset:
+            self.offset = offset
+            self.highlighted = None
+            self.draw_page()
+
+    def get_option_at(self, cell):
+        """
+        Returns the option at a screen cell.
+
+        :param cell: tuple<int>(x, y)
+        :return: int/None
+        """
+        x, y = cell
+        row = y - self.options_y
+        index = self.offset + row
+
+        if self.x <= x < self.x + self.width and 0 <= row < self.page_size and index < len(self.options):
+            return index
+
+        return None
+
+    def blit(self, con):
+        """
+        Copies the rows that changed since the last blit to con.
+
+        :param con: tdl.Console
+        """
+        for y in self.dirty_rows:
+            con.blit(self.window, self.x, self.y + y, self.width, 1, 0, y)
+
+        self.dirty_rows.clear()
+
+    def handle_event(self, event):
+        """
+        Applies an input event.
+
+        :param event: tdl.event.Event
+        :return: tuple(bool (menu closed), int/None (chosen option))
+        """
+        if event.type == 'MOUSEMOTION':
+            index = self.get_option_at(event.cell)
+            if index is not None:
+                self.highlight(index)
+        elif event.type == 'MOUSEDOWN' and event.button == 'LEFT':
+            return True, self.get_option_at(event.cell)
+        elif event.type == 'KEYDOWN':
+            if event.key == 'ENTER' and event.alt:
+                self.backend.set_fullscreen(not self.backend.get_fullscreen())
+                # the window was redrawn from scratch
+                self.dirty_rows.update(range(self.height))
+            elif event.key in ('ENTER', 'KPENTER'):
+                return True, self.highlighted
+            elif event.key == 'ESCAPE':
+                return True, None
+            elif event.key == 'UP':
+                self.highlight(self.offset if self.highlighted is None else self.highlighted - 1)
+            elif event.key == 'DOWN':
+                self.highlight(self.offset if self.highlighted is None else self.highlighted + 1)
+            elif event.key in ('PAGEUP', 'LEFT') or event.char == '<':
+                self.turn_page(-1)
+            elif event.key in ('PAGEDOWN', 'RIGHT') or event.char == '>':
+                self.turn_page(1)
+            elif event.char and 'a' <= event.char <= 'z':
+                index = self.offset + ord(event.char) - ord('a')
+                if ord(event.char) - ord('a') < self.page_size and index < len(self.options):
+                    return True, index
+
+        return False, None
+
+    def run(self, con, timeout=0.5, poll_interval=0.01, events=None):
+        """
+        Shows the menu on con until an option is chosen or the menu is closed. Waits for input between frames and
+        only flushes when the menu changed.
+
+        :param con: tdl.Console (the root console)
+        :param timeout: float (seconds to wait for input before checking whether the window was closed)
+        :param poll_interval: float (seconds)
+        :param events: collections.deque/None (events not handled yet, shared with the caller so input typed ahead
+                       of the menu reaches it and input after it closed is left for the game)
+        :return: int/None (chosen option)
+        """
+        if events is None:
+            events = deque()
+
+        self.dirty_rows.update(range(self.height))
+
+        while not self.backend.event.is_window_closed():
+            if self.dirty_rows:
+                self.blit(con)
+                self.backend.flush()
+
+            wait_for_events(events, timeout, poll_interval, self.backend)
+
+            while events:
+                closed, index = self.handle_event(events.popleft())
+
+                if closed:
+                    return index
+
+        return None
@@ -0,0 +1,79 @@
+"""
+Colors as small integer ids with precomputed lookup tables.
+
+A Palette is the colors dict every module already takes, so colors.get('red') keeps working for messages and the
+panel. Map cells and entities store ids instead of RGB tuples, and the renderer turns them into colors by indexing
+the tables with whole arrays. A theme replaces the table contents in place: ids stay valid and nothing else changes.
+"""
+import numpy as np
+
+
+# tile kinds; a map cell's kind is whether it blocks sight
+TILE_GROUND = 0
+TILE_WALL = 1
+
+# background colors of the tile kinds, out of view and in view
+TILE_COLORS = [
+    ('dark_ground', 'dark_wall'),
+    ('light_ground', 'light_wall'),
+]
+
+
+class Palette(dict):
+    def __init__(self, colors):
+        """
+        :param colors: dict<tuple<int>(r, g, b)> (ids are assigned in this order)
+        """
+        super().__init__()
+
+        # name -> int
+        self.ids = {}
+        # RGB of every id
+        self.rgb = np.zeros((0, 3), dtype=np.uint8)
+        # tile backgrounds, see get_tile_indices
+        self.tile_rgb = None
+
+        self.set_colors(colors)
+
+    def set_colors(self, colors):
+        """
+        Changes colors or adds new ones, e.g. to switch themes. Existing ids keep their meaning.
+
+        :param colors: dict<tuple<int>(r, g, b)>
+        """
+        new_names = [name for name in colors if name not in self.ids]
+
+        for name in new_names:
+            self.ids[name] = len(self.ids)
+
+        self.rgb = np.concatenate([self.rgb, np.zeros((len(new_names), 3), dtype=np.uint8)])
+
+        for name, color in colors.items():
+            self[name] = tuple(color)
+            self.rgb[self.ids[name]] = color
+
+        if all(name in self.ids for kind in TILE_COLORS for name in kind) and 'black' in self.ids:
+            # unexplored tiles first, then each tile kind out of view, then in view
+            self.tile_rgb = self.rgb[[self.ids['black']] + [self.ids[name] for kind in TILE_COLORS for name in kind]]
+
+    def id(self, name):
+        """
+        Returns the id of a color.
+
+        :param name: string
+        :return: int
+        """
+        return self.ids[name]
+
+    def get_tile_indices(self, explored, fov, walls):
+        """
+        Returns the row of tile_rgb for every cell.
+
+        :param explored: numpy.ndarray<bool>
+        :param fov: numpy.ndarray<bool>
+        :param walls: numpy.ndarray<bool>
+        :return: numpy.ndarray<uint8>
+        """
+        tile_kinds = len(TILE_COLORS[0])
+
+        return explored * (1 + fov * tile_kinds + walls).astype(np.uint8)
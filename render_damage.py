@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class DamageTracker:
+    def __init__(self, width, height):
+        """
+        Records which map cells and panel sections changed since the last frame, so that only those get redrawn.
+
+        :param width: int
+        :param height: int
+        """
+        self.width = width
+        self.height = height
+        self.cells = np.zeros((width, height), dtype=bool, order='F')
+        self.previous_fov = np.zeros((width, height), dtype=bool, order='F')
+        self.panel_signatures = {}
+        # the first frame draws everything
+        self.full = True
+
+    def mark_cell(self, x, y):
+        """
+        Marks map cell for redrawing.
+
+        :param x: int
+        :param y: int
+        """
+        self.cells[x, y] = True
+
+    def mark_fov(self, fov):
+        """
+        Marks cells whose visibility changed since the last recorded FOV.
+
+        :param fov: numpy.ndarray<bool>
+        """
+        self.cells |= fov != self.previous_fov
+        self.previous_fov[...] = fov
+
+    def mark_cells(self, cells):
+        """
+        Marks every cell set in cells for redrawing.
+
+        :param cells: numpy.ndarray<bool>
+        """
+        self.cells |= cells
+
+    def mark_all(self):
+        """
+        Redraws and re-blits everything on the next frame, e.g. after a menu was drawn over the root console.
+        """
+        self.full = True
+        self.panel_signatures.clear()
+
+    def panel_changed(self, section, signature):
+        """
+        Returns True if the inputs of a panel section differ from the ones it was last drawn with.
+
+        :param section: string
+        :param signature: tuple
+        :return: bool
+        """
+        if self.panel_signatures.get(section) == signature:
+            return False
+
+        self.panel_signatures[section] = signature
+        return True
+
+    def get_dirty_spans(self):
+        """
+        Returns horizontal spans covering the dirty cells, one per row.
+
+        :return: list<tuple<int>(x, y, width)>
+        """
+        spans = []
+
+        for y in np.flatnonzero(self.cells.any(axis=0)):
+            xs = np.flatnonzero(self.cells[:, y])
+            spans.append((int(xs[0]), int(y), int(xs[-1] - xs[0] + 1)))
+
+        return spans
+
+    def clear(self):
+        """
+        Forgets damage after a frame was presented.
+        """
+        self.cells[...] = False
+        self.full = False
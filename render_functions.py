@@ -1,12 +1,21 @@
 from enum import Enum
-import textwrap
-import tdl
+import weakref
+
+import numpy as np
+import tcod.console
+
+import instrumentation
+
+
+# tdl.Console -> tcod.console.Console wrapping its buffers, dropped with the console
+_console_buffers = weakref.WeakKeyDictionary()
 
 
 class RenderOrder(Enum):
-    CORPSE = 1
-    ITEM = 2
-    ACTOR = 3
+    STAIRS = 1
+    CORPSE = 2
+    ITEM = 3
+    ACTOR = 4
 
 
 def get_entities_under_mouse(mouse_coordinates, entities, game_map):
@@ -14,14 +23,13 @@ def get_entities_under_mouse(mouse_coordinates, entities, game_map):
     Used for displaying info when entities are hovered.
 
     :param mouse_coordinates: tuple<int>(x, y)
-    :param entities: list<Entity>
+    :param entities: EntityIndex
     :param game_map: GameMap
     :return: list<Entity>
     """
     x, y = mouse_coordinates
 
-    entities_under_mouse = [entity for entity in entities
-                            if entity.x == x and entity.y == y and game_map.fov[entity.x, entity.y]]
+    entities_under_mouse = [entity for entity in entities.get_entities_at(x, y) if game_map.fov[x, y]]
 
     return entities_under_mouse
 
@@ -60,104 +68,14 @@ def render_bar(panel, x, y, total_width, name, value, maximum, bar_color, back_c
     panel.draw_str(x_centered, y, text, fg=string_color, bg=None)
 
 
-def menu(con, header, options, width, screen_height, screen_width, colors, mouse_coordinates=(0, 0)):
-    """
-    Renders a menu(inventory, shop etc). Returns a clicked option.
-
-    :param con: tdl.Console
-    :param header: string
-    :param options: array
-    :param width: int
-    :param screen_height: int
-    :param screen_width: int
-    :param colors: dict<tuple<int>(r, g, b)>
-    :param mouse_coordinates: tuple<int>(x, y)
-    :return: int/None
-    """
-    if len(options) > 26:
-        raise ValueError('Cannot have a menu with more than 26 options.')
-
-    # calculate total height for the header (after textwrap) and one line per option
-    header_wrapped = textwrap.wrap(header, width)
-    header_height = len(header_wrapped)
-    height = len(options) + header_height
-
-    # create an off-screen console that represents the menu's window
-    window = tdl.Console(width, height)
-
-    # print the header, with wrapped text
-    window.draw_rect(0, 0, width, height, None, fg=colors.get("white"), bg=None)
-    for i, line in enumerate(header_wrapped):
-        window.draw_str(0, 0 + i, header_wrapped[i])
-
-    y = header_height
-    letter_index = ord('a')
-    for option_text in options:
-        text = '(' + chr(letter_index) + ') ' + option_text
-        window.draw_str(0, y, text, bg=None)
-        y += 1
-        letter_index += 1
-
-    # blit the contents of "window" to the root console
-    x = screen_width // 2 - width // 2
-    y = screen_height // 2 - height // 2
-    con.blit(window, x, y, width, height, 0, 0)
-
-    # compute x and y offsets to convert console position to menu position
-    x_offset = x  # x is the left edge of the menu
-    y_offset = y + header_height  # subtract the height of the header from the top edge of the menu
-
-    while True:
-        # present the root console to the player and check for input
-        tdl.flush()
-        user_input = None
-        button = None
-        for event in tdl.event.get():
-            if event.type == 'KEYDOWN':
-                user_input = event
-            if event.type == 'MOUSEDOWN':
-                button = event.button
-                mouse_coordinates = event.cell
-            if event.type == 'MOUSEMOTION':
-                button = None
-                mouse_coordinates = event.cell
-        else:
-            user_input = None
-            button = None
-
-        letter_index = ord('a')
-        for option_text in options:
-            text = '(' + chr(letter_index) + ') ' + option_text
-            menu_y = mouse_coordinates[1] - y_offset
-            if menu_y == mouse_coordinates[0]:
-                bg = colors.get("white")
-            else:
-                bg = None
-
-            window.draw_str(0, y, text, bg=bg)
-            y += 1
-            letter_index += 1
-
-        if button == "LEFT":
-            menu_x, menu_y = (mouse_coordinates[0] - x_offset, mouse_coordinates[1] - y_offset)
-            # check if click is within the menu and on a choice
-            if width > menu_x >= 0 and height - header_height > menu_y >= 0:
-                return menu_y
-            else:
-                return None
-
-        if user_input.key == 'ENTER' and user_input.alt:
-            tdl.set_fullscreen(not tdl.get_fullscreen())
-
-
 def render_all(con, panel, entities, player, game_map, fov_recompute, root_console, message_log, screen_width,
-               screen_height, bar_width, panel_height, panel_y, mouse_coordinates, colors):
+               screen_height, bar_width, panel_height, panel_y, mouse_coordinates, colors, damage, light_map=None):
     """
-    Renders all.
+    Renders all. Only cells and panel sections recorded as damaged are redrawn and blitted.
 
     :param con: tdl.Console
     :param panel: tdl.Console
-    :param entities: list<Entity>
+    :param entities: EntityIndex
     :param player: Entity
     :param game_map: GameMap
     :param fov_recompute: bool
@@ -169,42 +87,94 @@ def render_all(con, panel, entities, player, game_map, fov_recompute, root_conso
     :param panel_height: int
     :param panel_y: int
     :param mouse_coordinates: tuple(x, y)
-    :param colors: dict<tuple<int>(r, g, b)>
+    :param colors: Palette
+    :param damage: DamageTracker
+    :param light_map: LightMap/None (None shows every tile in view fully lit)
     """
-    if fov_recompute:
-        for x, y in game_map:
-            wall = not game_map.transparent[x, y]
+    profiler = instrumentation.profiler
+
+    light_changed = False
+
+    if light_map is not None:
+        with profiler.phase('lighting'):
+            light_changed = light_map.update()
+
+    if fov_recompute or damage.full or light_changed:
+        with profiler.phase('render_tiles'):
+            render_tiles(con, game_map, colors, light_map)
+            damage.mark_fov(game_map.fov)
+
+            if light_changed:
+                # tiles that stayed in view changed color with the light
+                damage.mark_cells(game_map.fov)
+
+    with profiler.phase('render_entities'):
+        if damage.full:
+            # wipe every glyph but keep the tile colors
+            con.draw_rect(0, 0, game_map.width, game_map.height, ' ', fg=None, bg=None)
 
-            if game_map.fov[x, y]:
-                if wall:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('light_wall'))
-                else:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('light_ground'))
-                game_map.explored[x][y] = True
-            elif game_map.explored[x][y]:
-                if wall:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('dark_wall'))
-                else:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('dark_ground'))
+            visible_cells = [tuple(cell) for cell in np.argwhere(game_map.fov).tolist()]
 
-    entities_in_render_order = sorted(entities, key=lambda x: x.render_order.value)
+            # only entities in view are drawn, bottom layer first
+            entities_drawn = draw_entities(con, entities.get_visible_in_render_order(game_map.fov, visible_cells),
+                                           game_map.fov, colors)
 
-    # Draw all entities in the list
-    for entity in entities_in_render_order:
-        draw_entity(con, entity, game_map.fov)
+            root_console.blit(con, 0, 0, screen_width, screen_height, 0, 0)
+            profiler.count('cells_drawn', game_map.width * game_map.height)
+        else:
+            dirty = np.argwhere(damage.cells)
+            dirty_cells = dirty.tolist()
+
+            get_console_buffers(con).ch[dirty[:, 0], dirty[:, 1]] = ord(' ')
+
+            # each cell's entities are kept in render order
+            entities_drawn = draw_entities(con, (entity for x, y in dirty_cells
+                                                 for entity in entities.get_entities_at(x, y)), game_map.fov, colors)
+
+            for x, y, width in damage.get_dirty_spans():
+                root_console.blit(con, x, y, width, 1, x, y)
+
+            profiler.count('cells_drawn', len(dirty_cells))
+
+        profiler.count('entities_scanned', entities_drawn)
+
+    entities_under_mouse = get_entities_under_mouse(mouse_coordinates, entities, game_map)
 
-    root_console.blit(con, 0, 0, screen_width, screen_height, 0, 0)
+    # the panel sections overlap (hover bars run into the message column), so a change in any of them
+    # recomposes the whole panel
+    hp_changed = damage.panel_changed('hp', (player.fighter.hp, player.fighter.max_hp))
+    messages_changed = damage.panel_changed('messages', (message_log.revision,))
+    hover_changed = damage.panel_changed('hover', tuple(
+        (entity.name, entity.render_order, entity.fighter and entity.fighter.hp) for entity in entities_under_mouse))
 
+    if hp_changed or messages_changed or hover_changed:
+        with profiler.phase('render_panel'):
+            render_panel(panel, player, entities_under_mouse, message_log, bar_width, colors)
+
+            root_console.blit(panel, 0, panel_y, screen_width, panel_height, 0, 0)
+
+    damage.clear()
+
+
+def render_panel(panel, player, entities_under_mouse, message_log, bar_width, colors):
+    """
+    Renders the panel: HP bar, game messages and info about hovered entities.
+
+    :param panel: tdl.Console
+    :param player: Entity
+    :param entities_under_mouse: list<Entity>
+    :param message_log: MessageLog
+    :param bar_width: int
+    :param colors: dict<tuple<int>(r, g, b)>
+    """
     panel.clear(fg=colors.get('white'), bg=colors.get('black'))
 
     # Print the game messages, one line at a time
     y = 1
-    for message in message_log.messages:
-        panel.draw_str(message_log.x, y, message.text, bg=None, fg=message.color)
+    for text, color in message_log.get_lines():
+        panel.draw_str(message_log.x, y, text, bg=None, fg=color)
         y += 1
 
-    entities_under_mouse = get_entities_under_mouse(mouse_coordinates, entities, game_map)
-
     render_bar(panel, 1, 0, bar_width, 'HP', player.fighter.hp, player.fighter.max_hp,
                colors.get('light_red'), colors.get('darker_red'), colors.get('white'))
 
@@ -217,37 +187,95 @@ def render_all(con, panel, entities, player, game_map, fov_recompute, root_conso
                        player.fighter.max_hp, colors.get('light_red'), colors.get('darker_red'), colors.get('white'))
         y += 1
 
-    root_console.blit(panel, 0, panel_y, screen_width, panel_height, 0, 0)
 
+def get_console_buffers(con):
+    """
+    Returns the characters and colors of a console as writable arrays indexed by [x, y] (ch, fg and bg).
 
-def clear_all(con, entities):
+    :param con: tdl.Console/terminal_backend.Console
+    :return: tcod.console.Console/terminal_backend.Console
     """
-    Clears all entities.
+    if not hasattr(con, 'console_c'):
+        # terminal consoles are numpy arrays already
+        return con
+
+    buffers = _console_buffers.get(con)
+
+    if buffers is None:
+        # tdl has no public way to reach a console's buffers, so this relies on tcod's _from_cdata; .landscape.yaml
+        # pins the tcod versions it was checked against
+        buffers = tcod.console.Console._from_cdata(con.console_c, order='F')
+        _console_buffers[con] = buffers
+
+    return buffers
+
+
+def get_console_bg(con):
+    """
+    Returns the background colors of a console as a writable array indexed by [x, y].
 
     :param con: tdl.Console
-    :param entities: list<Entity>
+    :return: numpy.ndarray<uint8>(width, height, 3)
     """
-    for entity in entities:
-        clear_entity(con, entity)
+    return get_console_buffers(con).bg
 
 
-def draw_entity(con, entity, fov):
+def render_tiles(con, game_map, colors, light_map=None):
     """
-    Draws entity.
+    Renders map tiles in one pass over the whole map and marks visible tiles as explored.
+    Unexplored tiles are painted black, so the map can be redrawn after it moved.
 
     :param con: tdl.Console
-    :param entity: Entity
-    :param fov: tdl.Map.fov
+    :param game_map: GameMap
+    :param colors: Palette
+    :param light_map: LightMap/None (tiles in view go from their out of view color to their in view color with
+                      the light they receive)
     """
-    if fov[entity.x, entity.y]:
-        con.draw_char(entity.x, entity.y, entity.char, entity.color, bg=None)
+    fov = game_map.fov
+    game_map.explored |= fov
+    walls = ~game_map.transparent
+
+    # unexplored tiles stay black
+    bg = get_console_bg(con)[:game_map.width, :game_map.height]
+    bg[...] = colors.tile_rgb[colors.get_tile_indices(game_map.explored, fov, walls)]
+
+    if light_map is None:
+        return
 
+    xs, ys = np.nonzero(fov)
+    dark = colors.tile_rgb[colors.get_tile_indices(True, False, walls[xs, ys])].astype(np.float32)
+    lit = colors.tile_rgb[colors.get_tile_indices(True, True, walls[xs, ys])].astype(np.float32)
+    light = np.minimum(light_map.light[xs, ys] + light_map.ambient, 1)
 
-def clear_entity(con, entity):
+    bg[xs, ys] = dark + (lit - dark) * light
+
+
+def draw_entities(con, entities, fov, colors):
     """
-    Erases the character that represents entity.
+    Draws entities in view straight into the console's buffers. Where entities share a cell the last one is on top.
 
     :param con: tdl.Console
-    :param entity: Entity
+    :param entities: iterable<Entity> (bottom first)
+    :param fov: tdl.Map.fov
+    :param colors: Palette
+    :return: int (number of entities looked at)
     """
-    con.draw_char(entity.x, entity.y, ' ', entity.color, bg=None)
+    drawn = [(entity.x, entity.y, ord(entity.char), entity.color) for entity in entities]
+
+    if not drawn:
+        return 0
+
+    xs, ys, chars, color_ids = np.array(drawn, dtype=np.intp).T
+    in_view = fov[xs, ys]
+
+    # the last entity in a cell is the one that shows
+    cells = (xs * fov.shape[1] + ys)[::-1]
+    _, last = np.unique(cells, return_index=True)
+    top = len(drawn) - 1 - last
+    top = top[in_view[top]]
+
+    buffers = get_console_buffers(con)
+    buffers.ch[xs[top], ys[top]] = chars[top]
+    buffers.fg[xs[top], ys[top]] = colors.rgb[color_ids[top]]
+
+    return len(drawn)
@@ -0,0 +1,214 @@
+"""
+Recording and headless replay of games.
+
+A recording is a JSON lines file: a header with the seed and settings the game was started with, then every player
+action in order, with a hash of the game state every few turns. Replaying starts the same game from the seed, feeds
+it the actions as fast as possible and checks the hashes, so a recorded session can be used to reproduce a crash or
+as a repeatable workload for performance runs.
+
+Usage:
+    python replay.py RECORDING [--no-verify] [--profile]
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+
+from game_messages import MessageLog
+from game_session import new_chunked_game, new_game
+import instrumentation
+from level_generation import LevelPregenerator
+from level_manager import LevelManager
+from palette import Palette
+
+
+# action keys that change the game; the rest only affect the user interface
+RECORDED_ACTIONS = ['move', 'pickup', 'take_stairs']
+
+
+class ReplayError(Exception):
+    pass
+
+
+def state_hash(session):
+    """
+    Returns a hash of the game state: turn, game state, every entity on the map and the inventory.
+
+    :param session: GameSession
+    :return: string
+    """
+    state = hashlib.sha1()
+    state.update(repr((session.turn, session.game_state.name)).encode('utf-8'))
+
+    for entity in session.entities:
+        state.update(repr((entity.x, entity.y, entity.char, entity.name,
+                           entity.fighter.hp if entity.fighter else None)).encode('utf-8'))
+
+    for entity in session.inventory:
+        state.update(entity.name.encode('utf-8'))
+
+    return state.hexdigest()
+
+
+def start_session(header):
+    """
+    Starts the game described by a recording header.
+
+    :param header: dict
+    :return: GameSession
+    """
+    settings = header['settings']
+    colors = Palette(header['colors'])
+    message_log = MessageLog(*header['message_log'])
+
+    if header['chunked']:
+        session = new_chunked_game(settings['map_width'], settings['map_height'], settings['chunk_size'],
+                                   settings['max_loaded_chunks'], message_log, colors, settings['fov_algorithm'],
+                                   settings['fov_radius'], settings['fov_light_walls'], seed=header['seed'])
+    else:
+        session = new_game(settings['map_width'], settings['map_height'], settings['max_rooms'],
+                           settings['room_min_size'], settings['room_max_size'], settings['max_monsters_per_room'],
+                           settings['max_room_items'], message_log, colors, settings['fov_algorithm'],
+                           settings['fov_radius'], settings['fov_light_walls'], seed=header['seed'])
+
+    session.corpse_lifetime = settings['corpse_lifetime']
+    # recordings from before the inventory could page hold 26 items
+    session.inventory_capacity = settings.get('inventory_capacity', 26)
+
+    if not header['chunked']:
+        # floors are generated from their seeds, so generating them on demand gives the recorded levels
+        session.level_source = LevelPregenerator(settings, colors, header['seed'], background=False,
+                                                 entity_pool=session.entity_pool).get_level
+        session.levels = LevelManager(entity_pool=session.entity_pool)
+
+    return session
+
+
+class Recorder:
+    def __init__(self, path, header, checkpoint_interval=50):
+        """
+        Writes a recording. Every line is flushed, so the recording survives a crash of the game.
+
+        :param path: string
+        :param header: dict (seed, chunked, settings, colors and message_log, as read by start_session)
+        :param checkpoint_interval: int (turns between state hashes)
+        """
+        self.file = open(path, 'w', buffering=1)
+        self.checkpoint_interval = checkpoint_interval
+
+        self._write({'header': header})
+
+    def record(self, session, action, turn_taken):
+        """
+        Records an action after the session resolved it.
+
+        :param session: GameSession
+        :param action: dict
+        :param turn_taken: bool
+        """
+        recorded = {key: action[key] for key in RECORDED_ACTIONS if key in action}
+
+        if not recorded:
+            return
+
+        if 'take_stairs' in recorded and not turn_taken:
+            # the stairs were blocked or missing and nothing changed; a replay generates floors on demand, so it
+            # would take stairs the game found blocked
+            return
+
+        self._write({'action': recorded})
+
+        if turn_taken and session.turn % self.checkpoint_interval == 0:
+            self.checkpoint(session)
+
+    def checkpoint(self, session):
+        """
+        Records a hash of the current game state.
+
+        :param session: GameSession
+        """
+        self._write({'checkpoint': session.turn, 'hash': state_hash(session)})
+
+    def close(self, session):
+        """
+        Records a final checkpoint and closes the file.
+
+        :param session: GameSession
+        """
+        self.checkpoint(session)
+        self.file.close()
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+
+def replay(path, verify=True):
+    """
+    Replays a recording headless.
+
+    :param path: string
+    :param verify: bool (compare state hashes at checkpoints)
+    :return: tuple(GameSession, int (actions replayed), int (checkpoints verified))
+    """
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    if not entries or 'header' not in entries[0]:
+        raise ReplayError('{0} is not a recording.'.format(path))
+
+    session = start_session(entries[0]['header'])
+    actions = 0
+    checkpoints = 0
+
+    for entry in entries[1:]:
+        if 'action' in entry:
+            action = entry['action']
+            if 'move' in action:
+                action['move'] = tuple(action['move'])
+
+            session.take_action(action)
+            actions += 1
+        elif verify and 'checkpoint' in entry:
+            if session.turn != entry['checkpoint'] or state_hash(session) != entry['hash']:
+                raise ReplayError('Replay diverged at turn {0} (recorded turn {1}).'.format(
+                    session.turn, entry['checkpoint']))
+            checkpoints += 1
+
+    return session, actions, checkpoints
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording')
+    parser.add_argument('--no-verify', dest='verify', action='store_false', help='skip state hash checks')
+    parser.add_argument('--profile', action='store_true', help='print per-phase timings')
+    args = parser.parse_args()
+
+    if args.profile:
+        instrumentation.enable()
+
+    start = time.perf_counter()
+
+    try:
+        session, actions, checkpoints = replay(args.recording, args.verify)
+    except ReplayError as e:
+        print(e)
+        return 1
+
+    elapsed = time.perf_counter() - start
+
+    print('{0} actions, {1} turns, {2} checkpoints verified in {3:.3f} s ({4:.0f} turns/s)'.format(
+        actions, session.turn, checkpoints, elapsed, session.turn / elapsed if elapsed else 0))
+
+    if args.profile:
+        instrumentation.profiler.end_frame()
+        for name, mean, p95, maximum in instrumentation.profiler.get_summary():
+            # the whole replay is a single frame, so these are totals
+            print('{0:<16} {1:>10.3f} ms'.format(name, mean))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
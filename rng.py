@@ -0,0 +1,38 @@
+import random
+
+
+class RandomStreams:
+    def __init__(self, seed=None):
+        """
+        Independent random number generators of a session, all derived from one seed. Keeping map generation
+        and spawning apart means a change in how often one of them draws numbers doesn't change what the other
+        produces.
+
+        :param seed: int/None (random seed if None)
+        """
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 32)
+
+        self.seed = seed
+        self.map = self.derive('map')
+        self.spawn = self.derive('spawn')
+
+    def derive(self, name):
+        """
+        Returns a new generator seeded from the session seed and name, for example one per chunk.
+
+        :param name: string
+        :return: random.Random
+        """
+        return random.Random('{0}:{1}'.format(self.seed, name))
+
+
+def level_seed(session_seed, floor):
+    """
+    Returns the seed of a floor.
+
+    :param session_seed: int/string
+    :param floor: int
+    :return: string
+    """
+    return '{0}:floor:{1}'.format(session_seed, floor)
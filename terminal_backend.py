@@ -0,0 +1,455 @@
+"""
+Text terminal backend, for playing over SSH or in a container without a window.
+
+It offers the parts of tdl the game uses (Console, init, flush, event.get, event.is_window_closed and friends), so
+engine.main(terminal=True) swaps it in for tdl and render_all and Menu draw on it unchanged. Consoles keep their
+characters and colors in numpy arrays indexed by [x, y], like the tcod buffers render_functions writes to.
+
+flush compares the root console to a shadow copy of what the terminal shows and writes escape sequences only for
+cells that changed: the cursor is moved only where changed cells aren't adjacent, and colors are only sent when
+they differ from the previous cell's. Colors are 24 bit by default; 256 color mode sends shorter sequences.
+
+Input is read from stdin in cbreak mode: keys, and mouse motion and clicks where the terminal reports them.
+POSIX only.
+"""
+import atexit
+import codecs
+import os
+import re
+import select
+import sys
+import time
+
+import numpy as np
+
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+# escape sequences of special keys, as tdl key names
+KEY_SEQUENCES = {
+    '\x1b[A': 'UP', '\x1b[B': 'DOWN', '\x1b[C': 'RIGHT', '\x1b[D': 'LEFT',
+    '\x1bOA': 'UP', '\x1bOB': 'DOWN', '\x1bOC': 'RIGHT', '\x1bOD': 'LEFT',
+    '\x1b[5~': 'PAGEUP', '\x1b[6~': 'PAGEDOWN', '\x1b[H': 'HOME', '\x1b[F': 'END',
+}
+
+# SGR mouse report: button flags, column, row, pressed (M) or released (m)
+MOUSE_SEQUENCE = re.compile(r'\x1b\[<(\d+);(\d+);(\d+)([Mm])')
+
+# any other control sequence (function keys, focus reports...), ignored
+CONTROL_SEQUENCE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]')
+
+# the start of a control sequence that isn't complete yet
+PARTIAL_SEQUENCE = re.compile(r'\x1b(O|\[[0-?]*[ -/]*)?$')
+
+# mouse button flags: 3 for the button, 4, 8 and 16 for shift, alt and control, 32 for motion, 64 and up for the
+# wheel and extra buttons
+MOUSE_MOTION = 32
+MOUSE_WHEEL = 64
+
+
+class Console:
+    def __init__(self, width, height):
+        """
+        Off-screen console with the drawing methods of tdl.Console.
+
+        :param width: int
+        :param height: int
+        """
+        self.width = width
+        self.height = height
+        self.ch = np.full((width, height), ord(' '), dtype=np.int32)
+        self.fg = np.zeros((width, height, 3), dtype=np.uint8)
+        self.bg = np.zeros((width, height, 3), dtype=np.uint8)
+        self.fg[...] = WHITE
+
+    def draw_char(self, x, y, char, fg=Ellipsis, bg=Ellipsis):
+        """
+        :param x: int
+        :param y: int
+        :param char: string/int/None (None keeps the character)
+        :param fg: tuple<int>(r, g, b)/None/Ellipsis (None keeps the color, Ellipsis is white)
+        :param bg: tuple<int>(r, g, b)/None/Ellipsis (None keeps the color, Ellipsis is black)
+        """
+        self.draw_rect(x, y, 1, 1, char, fg, bg)
+
+    def draw_str(self, x, y, string, fg=Ellipsis, bg=Ellipsis):
+        """
+        Draws a string on one line, cut at the right edge.
+
+        :param x: int
+        :param y: int
+        :param string: string
+        :param fg: tuple<int>(r, g, b)/None/Ellipsis
+        :param bg: tuple<int>(r, g, b)/None/Ellipsis
+        """
+        string = string[:self.width - x]
+        cells = (slice(x, x + len(string)), y)
+
+        self.ch[cells] = [ord(char) for char in string]
+        self._set_colors(cells, fg, bg)
+
+    def draw_rect(self, x, y, width, height, string, fg=Ellipsis, bg=Ellipsis):
+        """
+        Fills a rectangle with one character.
+
+        :param x: int
+        :param y: int
+        :param width: int/None (to the right edge if None)
+        :param height: int/None (to the bottom edge if None)
+        :param string: string/int/None (None keeps the characters)
+        :param fg: tuple<int>(r, g, b)/None/Ellipsis
+        :param bg: tuple<int>(r, g, b)/None/Ellipsis
+        """
+        width = self.width - x if width is None else width
+        height = self.height - y if height is None else height
+        cells = (slice(x, x + width), slice(y, y + height))
+
+        if string is not None:
+            self.ch[cells] = string if isinstance(string, int) else ord(string)
+
+        self._set_colors(cells, fg, bg)
+
+    def clear(self, fg=Ellipsis, bg=Ellipsis):
+        """
+        :param fg: tuple<int>(r, g, b)/None/Ellipsis
+        :param bg: tuple<int>(r, g, b)/None/Ellipsis
+        """
+        self.ch[...] = ord(' ')
+        self.fg[...] = WHITE if fg in (None, Ellipsis) else fg
+        self.bg[...] = BLACK if bg in (None, Ellipsis) else bg
+
+    def blit(self, source, x=0, y=0, width=None, height=None, srcX=0, srcY=0):
+        """
+        Copies a rectangle of another console.
+
+        :param source: Console
+        :param x: int
+        :param y: int
+        :param width: int/None
+        :param height: int/None
+        :param srcX: int
+        :param srcY: int
+        """
+        width = min(source.width if width is None else width, self.width - x, source.width - srcX)
+        height = min(source.height if height is None else height, self.height - y, source.height - srcY)
+        target = (slice(x, x + width), slice(y, y + height))
+        origin = (slice(srcX, srcX + width), slice(srcY, srcY + height))
+
+        self.ch[target] = source.ch[origin]
+        self.fg[target] = source.fg[origin]
+        self.bg[target] = source.bg[origin]
+
+    def _set_colors(self, cells, fg, bg):
+        if fg is not None:
+            self.fg[cells] = WHITE if fg is Ellipsis else fg
+        if bg is not None:
+            self.bg[cells] = BLACK if bg is Ellipsis else bg
+
+
+class Terminal:
+    def __init__(self, width, height, stream=None, input_stream=None, colors=2 ** 24, escape_timeout=0.1):
+        """
+        The screen of a text terminal, drawn from a root console.
+
+        :param width: int
+        :param height: int
+        :param stream: binary file/None (stdout if None)
+        :param input_stream: file/None (stdin if None)
+        :param colors: int (2 ** 24 or 256)
+        :param escape_timeout: float (seconds to wait for the rest of an escape sequence)
+        """
+        self.root = Console(width, height)
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.input_fd = (input_stream if input_stream is not None else sys.stdin).fileno()
+        self.colors = colors
+        self.escape_timeout = escape_timeout
+        self.closed = False
+        # bytes written by the last flush
+        self.bytes_written = 0
+
+        # what the terminal shows; -1 never matches a character, so the first flush draws every cell
+        self.shown_ch = np.full((width, height), -1, dtype=np.int32)
+        self.shown_fg = np.zeros((width, height, 3), dtype=np.uint8)
+        self.shown_bg = np.zeros((width, height, 3), dtype=np.uint8)
+
+        self._saved_mode = None
+        # input read but not parsed yet: the start of an escape sequence whose rest hasn't arrived
+        self._pending_input = ''
+        self._pending_since = 0
+        # keeps a character split across reads together
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def open(self):
+        """
+        Switches to the alternate screen, hides the cursor and starts reading keys and mouse reports unbuffered.
+        """
+        import termios
+        import tty
+
+        if os.isatty(self.input_fd):
+            self._saved_mode = termios.tcgetattr(self.input_fd)
+            tty.setcbreak(self.input_fd)
+
+        # alternate screen, hidden cursor, mouse motion reports in SGR format
+        self._write(b'\x1b[?1049h\x1b[?25l\x1b[2J\x1b[?1003h\x1b[?1006h')
+        atexit.register(self.close)
+
+    def close(self):
+        """
+        Restores the terminal.
+        """
+        if self._saved_mode is not None:
+            import termios
+
+            termios.tcsetattr(self.input_fd, termios.TCSADRAIN, self._saved_mode)
+            self._saved_mode = None
+
+        self._write(b'\x1b[?1003l\x1b[?1006l\x1b[0m\x1b[?25h\x1b[?1049l')
+
+    def flush(self):
+        """
+        Writes the cells of the root console that changed since the last flush.
+        """
+        root = self.root
+        changed = root.ch != self.shown_ch
+        changed |= (root.bg != self.shown_bg).any(axis=2)
+        # the foreground of a blank cell doesn't show
+        changed |= (root.fg != self.shown_fg).any(axis=2) & (root.ch != ord(' '))
+
+        # terminals draw row by row
+        ys, xs = np.nonzero(changed.T)
+
+        if not len(xs):
+            self.bytes_written = 0
+            return
+
+        chars = root.ch[xs, ys].tolist()
+        fgs = self._color_codes(root.fg[xs, ys])
+        bgs = self._color_codes(root.bg[xs, ys])
+
+        out = []
+        cursor = None
+        pen_fg = None
+        pen_bg = None
+
+        for x, y, char, fg, bg in zip(xs.tolist(), ys.tolist(), chars, fgs, bgs):
+            if cursor != (x, y):
+                if cursor is not None and cursor[1] == y and cursor[0] < x:
+                    out.append('\x1b[{0}C'.format(x - cursor[0]))
+                else:
+                    out.append('\x1b[{0};{1}H'.format(y + 1, x + 1))
+
+            if bg != pen_bg:
+                out.append('\x1b[48;{0}m'.format(bg))
+                pen_bg = bg
+
+            if fg != pen_fg and char != 32:
+                out.append('\x1b[38;{0}m'.format(fg))
+                pen_fg = fg
+
+            out.append(chr(char))
+            cursor = (x + 1, y)
+
+        self.shown_ch[...] = root.ch
+        self.shown_fg[...] = root.fg
+        self.shown_bg[...] = root.bg
+
+        data = ''.join(out).encode('utf-8')
+        self.bytes_written = len(data)
+        self._write(data)
+
+    def get_events(self):
+        """
+        Returns the keys pressed and mouse reports received since the last call, without waiting. An escape
+        sequence split across reads is kept until the rest arrives; escape on its own is only a key once nothing
+        followed it for escape_timeout seconds.
+
+        :return: list<KeyDown/MouseMotion/MouseDown>
+        """
+        while select.select([self.input_fd], [], [], 0)[0]:
+            data = os.read(self.input_fd, 1024)
+
+            if not data:
+                self.closed = True
+                break
+
+            if not self._pending_input:
+                self._pending_since = time.monotonic()
+
+            self._pending_input += self._decoder.decode(data)
+
+        # after the timeout, or at the end of input, whatever is left is taken as typed
+        complete = self.closed or time.monotonic() - self._pending_since >= self.escape_timeout
+
+        events, parsed = parse_input(self._pending_input, complete)
+        self._pending_input = self._pending_input[parsed:]
+
+        return events
+
+    def _color_codes(self, colors):
+        """
+        :param colors: numpy.ndarray<uint8>(n, 3)
+        :return: list<string> (SGR color arguments after 38; or 48;)
+        """
+        if self.colors == 256:
+            # nearest color of the 6x6x6 cube
+            levels = (colors.astype(np.int32) * 5 + 127) // 255
+            codes = 16 + levels[:, 0] * 36 + levels[:, 1] * 6 + levels[:, 2]
+            return ['5;{0}'.format(code) for code in codes.tolist()]
+
+        return ['2;{0};{1};{2}'.format(*color) for color in colors.tolist()]
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+
+class KeyDown:
+    type = 'KEYDOWN'
+
+    def __init__(self, key, char='', alt=False):
+        """
+        :param key: string (tdl key name, 'CHAR' for printable characters)
+        :param char: string
+        :param alt: bool
+        """
+        self.key = key
+        self.char = char
+        self.alt = alt
+
+
+class MouseMotion:
+    type = 'MOUSEMOTION'
+
+    def __init__(self, cell):
+        """
+        :param cell: tuple<int>(x, y)
+        """
+        self.cell = cell
+
+
+class MouseDown:
+    type = 'MOUSEDOWN'
+
+    def __init__(self, cell, button):
+        """
+        :param cell: tuple<int>(x, y)
+        :param button: string
+        """
+        self.cell = cell
+        self.button = button
+
+
+def parse_input(text, complete=True):
+    """
+    Turns terminal input into events.
+
+    :param text: string
+    :param complete: bool (False stops at an escape sequence that may not have fully arrived)
+    :return: tuple(list<KeyDown/MouseMotion/MouseDown>, int (characters parsed))
+    """
+    events = []
+    i = 0
+
+    while i < len(text):
+        if not complete and PARTIAL_SEQUENCE.match(text, i):
+            break
+
+        mouse = MOUSE_SEQUENCE.match(text, i)
+
+        if mouse:
+            flags, column, row, action = mouse.groups()
+            flags = int(flags)
+            cell = (int(column) - 1, int(row) - 1)
+
+            if flags & MOUSE_MOTION:
+                events.append(MouseMotion(cell))
+            elif action == 'M' and flags < MOUSE_WHEEL and flags & 3 == 0:
+                events.append(MouseDown(cell, 'LEFT'))
+
+            i = mouse.end()
+            continue
+
+        for sequence, key in KEY_SEQUENCES.items():
+            if text.startswith(sequence, i):
+                events.append(KeyDown(key))
+                i += len(sequence)
+                break
+        else:
+            control = CONTROL_SEQUENCE.match(text, i)
+
+            if control:
+                i = control.end()
+                continue
+
+            char = text[i]
+            i += 1
+
+            if char == '\x1b' and i < len(text) and text[i] != '\x1b':
+                # escape followed by a key is that key with alt held
+                events.append(_key_event(text[i], alt=True))
+                i += 1
+            else:
+                events.append(_key_event(char))
+
+    return events, i
+
+
+def _key_event(char, alt=False):
+    if char in ('\r', '\n'):
+        return KeyDown('ENTER', alt=alt)
+    if char == '\x1b':
+        return KeyDown('ESCAPE', alt=alt)
+    if char in ('\x7f', '\b'):
+        return KeyDown('BACKSPACE', alt=alt)
+
+    return KeyDown('CHAR', char, alt)
+
+
+# the tdl functions the game calls, backed by one terminal
+
+terminal = None
+
+
+def set_font(*args, **kwargs):
+    pass
+
+
+def init(width, height, title=None, colors=2 ** 24):
+    """
+    Takes over the terminal and returns the root console.
+
+    :param width: int
+    :param height: int
+    :param title: string (unused)
+    :param colors: int (2 ** 24 or 256)
+    :return: Console
+    """
+    global terminal
+    terminal = Terminal(width, height, colors=colors)
+    terminal.open()
+
+    return terminal.root
+
+
+def flush():
+    terminal.flush()
+
+
+def set_fullscreen(fullscreen):
+    pass
+
+
+def get_fullscreen():
+    return False
+
+
+class event:
+    @staticmethod
+    def get():
+        return terminal.get_events()
+
+    @staticmethod
+    def is_window_closed():
+        return terminal.closed
@@ -0,0 +1,138 @@
+import itertools
+
+
+# speed of an ordinary actor; an actor with twice the speed acts twice as often
+NORMAL_SPEED = 100
+# cost of an ordinary action, in time units at normal speed
+ACTION_COST = 100
+
+
+def action_delay(entity, cost=ACTION_COST):
+    """
+    Returns how long an action keeps entity busy.
+
+    :param entity: Entity
+    :param cost: int
+    :return: float
+    """
+    return cost * NORMAL_SPEED / entity.speed
+
+
+class TurnScheduler:
+    def __init__(self):
+        """
+        Binary heap of actors keyed by the time of their next action. Actors due at the same time act in the order
+        they were scheduled. A position map lets actors be removed from the middle of the heap in O(log n).
+        """
+        # entries are [time, sequence, entity]
+        self.heap = []
+        # entity -> position of its entry in heap
+        self.positions = {}
+        self.time = 0
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, entity):
+        return entity in self.positions
+
+    def schedule(self, entity, delay=0):
+        """
+        Schedules entity to act delay time units from now, or from its current due time if it is already
+        scheduled, so that fractional delays of fast and slow actors carry over between actions.
+
+        :param entity: Entity
+        :param delay: float
+        """
+        position = self.positions.get(entity)
+
+        if position is None:
+            self.heap.append([self.time + delay, next(self.sequence), entity])
+            self.positions[entity] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+        else:
+            entry = self.heap[position]
+            entry[0] += delay
+            entry[1] = next(self.sequence)
+            self._sift_down(position)
+
+    def remove(self, entity):
+        """
+        Removes entity from the schedule, if it is scheduled.
+
+        :param entity: Entity
+        """
+        position = self.positions.pop(entity, None)
+
+        if position is None:
+            return
+
+        last = self.heap.pop()
+
+        if position == len(self.heap):
+            return
+
+        self.heap[position] = last
+        self.positions[last[2]] = position
+        self._sift_down(position)
+        self._sift_up(self.positions[last[2]])
+
+    def advance(self, delay):
+        """
+        Moves the clock forward.
+
+        :param delay: float
+        """
+        self.time += delay
+
+    def due(self):
+        """
+        Yields actors whose action is due, earliest first. The caller reschedules each actor after it acted; if the
+        new time is still due the actor comes up again, so fast actors get several actions.
+
+        :return: iterator<Entity>
+        """
+        while self.heap and self.heap[0][0] <= self.time:
+            yield self.heap[0][2]
+
+    def _sift_up(self, position):
+        heap = self.heap
+        entry = heap[position]
+
+        while position > 0:
+            parent = (position - 1) // 2
+
+            if heap[parent][:2] <= entry[:2]:
+                break
+
+            heap[position] = heap[parent]
+            self.positions[heap[position][2]] = position
+            position = parent
+
+        heap[position] = entry
+        self.positions[entry[2]] = position
+
+    def _sift_down(self, position):
+        heap = self.heap
+        entry = heap[position]
+        size = len(heap)
+
+        while True:
+            child = 2 * position + 1
+
+            if child >= size:
+                break
+
+            if child + 1 < size and heap[child + 1][:2] < heap[child][:2]:
+                child += 1
+
+            if entry[:2] <= heap[child][:2]:
+                break
+
+            heap[position] = heap[child]
+            self.positions[heap[position][2]] = position
+            position = child
+
+        heap[position] = entry
+        self.positions[entry[2]] = position